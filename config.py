@@ -11,8 +11,67 @@ class Settings(BaseSettings):
     GARMIN_PASSWORD: str
     OPENAI_API_KEY: SecretStr
     OPENAI_ASSISTANT_ID: str
-    
-    
+
+    # Context Gathering (per-source timeout, seconds)
+    CONTEXT_TIMEOUT_GARMIN: float = 10.0
+    CONTEXT_TIMEOUT_CALENDAR: float = 6.0
+    CONTEXT_TIMEOUT_TASKS: float = 6.0
+
+    # Assistant Runs
+    ASSISTANT_RUN_DEADLINE_SECONDS: float = 90.0 # Hard limit, the run is cancelled after this
+    ASSISTANT_SUPERSEDE_POLICY: str = "cancel" # 'cancel' stale runs or 'queue' behind them
+    ASSISTANT_SYNC_INSTRUCTIONS: bool = True # Push system_prompt_specialist.md to the Assistant (False = only report drift)
+    THREAD_MAX_MESSAGES: int = 40 # Rotate (summarize + new thread) past this...
+    THREAD_MAX_PROMPT_TOKENS: int = 12000 # ...or past this prompt size
+
+    # Local Intent Classifier (train with train_intent_classifier.py)
+    INTENT_MODEL_PATH: str = "data/intent_model.npz"
+    INTENT_CLASSIFIER_THRESHOLD: float = 0.8 # Below this, ask the LLM router
+
+    # Router Decision Cache
+    ROUTE_CACHE_TTL_HOURS: float = 72
+    ROUTE_CACHE_MAX_ENTRIES: int = 1000
+    ROUTE_CACHE_MAX_KEY_CHARS: int = 80 # Longer messages rarely repeat
+
+    # Inbound Message Coalescing (per chat debounce, 0 disables the wait)
+    COALESCE_WINDOW_SECONDS: float = 1.2
+    COALESCE_MAX_WAIT_SECONDS: float = 4.0
+
+    # Google API Clients (shared aiohttp pool)
+    GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS: float = 300 # Refresh this long before the token expires
+    GOOGLE_TOKEN_CHECK_INTERVAL_SECONDS: float = 60
+    GOOGLE_HTTP_POOL_SIZE: int = 20 # Max open keep-alive connections
+    GOOGLE_HTTP_KEEPALIVE_SECONDS: float = 60
+    GOOGLE_HTTP_TIMEOUT_SECONDS: float = 20
+
+    # Calendar
+    CALENDAR_LIST_TTL_SECONDS: float = 6 * 3600 # Subscribed calendars rarely change
+    CALENDAR_FANOUT_CONCURRENCY: int = 8 # Parallel events.list calls per agenda read
+    CALENDAR_SYNC_INTERVAL_SECONDS: float = 120 # Background incremental sync of the local mirror
+    CALENDAR_MIRROR_MAX_STALENESS_SECONDS: float = 900 # Older than this -> read from Google again
+    CALENDAR_MIRROR_PAST_DAYS: int = 30 # Window start of a full download
+    CALENDAR_MIRROR_FUTURE_DAYS: int = 365 # Window end (recurring events expand up to here)
+    CALENDAR_MIRROR_FULL_RESYNC_HOURS: float = 24 # Full download to roll the window forward
+    WORK_DAY_START_HOUR: int = 9 # Free-slot search window (local time)
+    WORK_DAY_END_HOUR: int = 19
+    WORK_DAYS: List[int] = [0, 1, 2, 3, 4] # Monday = 0
+
+    # Tasks
+    TASKS_SYNC_INTERVAL_SECONDS: float = 120 # Background delta sync (updatedMin) of the local mirror
+    TASKS_MIRROR_MAX_STALENESS_SECONDS: float = 300 # Reads older than this sync first
+
+    # Garmin
+    GARMIN_TOKEN_DIR: str = ".garminconnect" # Saved session tokens (resumed instead of a new SSO login)
+    GARMIN_REFRESH_INTERVAL_SECONDS: float = 300 # Background refresh of today's metrics
+    GARMIN_METRICS_TTL_SECONDS: float = 900 # Older cached metrics trigger a refresh on read
+    ENERGY_INGEST_INTERVAL_HOURS: float = 6 # Pulls yesterday + today into EnergyLog
+    ENERGY_BACKFILL_DAYS: int = 30 # History downloaded on the first run
+    ENERGY_INGEST_BATCH_SIZE: int = 1000 # Rows per insert transaction
+
+    # Energy Analytics (consultant prompt insights)
+    ANALYTICS_WINDOW_DAYS: int = 60
+    ANALYTICS_MIN_SAMPLES: int = 7 # Days with data needed before a correlation/weekday effect is reported
+
     # Paths
     DB_PATH: str = "sqlite+aiosqlite:///jarvisz.db"
     
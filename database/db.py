@@ -12,3 +12,7 @@ async def init_db():
     async with engine.begin() as conn:
         # await conn.run_sync(Base.metadata.drop_all) # Uncomment to reset
         await conn.run_sync(Base.metadata.create_all)
+        # create_all skips existing tables: add indexes declared after a table was created
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                await conn.run_sync(index.create, checkfirst=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey, Text, Boolean, Index, LargeBinary
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 
@@ -43,12 +43,15 @@ class EnergyLog(Base):
     user_id = Column(Integer, ForeignKey('users.id'))
     timestamp = Column(DateTime, default=datetime.utcnow)
     
-    level = Column(Integer) # 0-100 (Body Battery or subjective)
-    source = Column(String) # 'manual', 'garmin'
+    level = Column(Integer) # 0-100 (Body Battery, sleep score or subjective)
+    source = Column(String) # 'manual', 'garmin_sleep' (intraday Garmin series live in BiometricDay)
     context = Column(String, nullable=True) # e.g. "After work", "Woke up"
     
     user = relationship("User", back_populates="energy_logs")
 
+    # One point per user, time and source: re-ingesting a day is a no-op
+    __table_args__ = (Index('ux_energy_logs_point', 'user_id', 'timestamp', 'source', unique=True),)
+
 class JournalEntry(Base):
     __tablename__ = 'journal_entries'
     
@@ -74,3 +77,62 @@ class KPIEvent(Base):
     user = relationship("User", back_populates="kpi_events")
 
 User.kpi_events = relationship("KPIEvent", back_populates="user")
+
+class RouteCacheEntry(Base):
+    __tablename__ = 'route_cache'
+    
+    key = Column(String, primary_key=True) # Normalized message text
+    destination = Column(String) # 'casual', 'management', 'breakdown', 'consultant'
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class AssistantThread(Base):
+    __tablename__ = 'assistant_threads'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    thread_id = Column(String) # OpenAI Assistants thread
+    message_count = Column(Integer, default=0) # Since the thread was opened
+    prompt_tokens = Column(Integer, default=0) # Prompt size of the last run
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class CalendarMirrorEvent(Base):
+    __tablename__ = 'calendar_events'
+    
+    calendar_id = Column(String, primary_key=True)
+    event_id = Column(String, primary_key=True)
+    data = Column(Text) # Raw event JSON from the Calendar API
+
+class CalendarSyncState(Base):
+    __tablename__ = 'calendar_sync_state'
+    
+    calendar_id = Column(String, primary_key=True)
+    summary = Column(String, nullable=True)
+    is_primary = Column(Boolean, default=False)
+    sync_token = Column(String, nullable=True) # nextSyncToken of the last events.list
+    synced_at = Column(DateTime, nullable=True) # Last successful (incremental or full) sync
+    full_synced_at = Column(DateTime, nullable=True) # Last full download
+
+class TaskListMirror(Base):
+    __tablename__ = 'task_lists'
+    
+    list_id = Column(String, primary_key=True)
+    title = Column(String)
+    position = Column(Integer, default=0) # Order returned by tasklists.list
+    synced_at = Column(DateTime, nullable=True) # updatedMin watermark for the next delta
+
+class TaskMirrorItem(Base):
+    __tablename__ = 'task_items'
+    
+    list_id = Column(String, primary_key=True)
+    task_id = Column(String, primary_key=True)
+    data = Column(Text) # Raw task JSON from the Tasks API (pending tasks only)
+
+class BiometricDay(Base):
+    __tablename__ = 'biometric_days'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    day = Column(Date, primary_key=True) # Local date (Argentina)
+    # Intraday series, delta-encoded NumPy arrays (see services/biometric_store.py)
+    body_battery = Column(LargeBinary, nullable=True)
+    stress = Column(LargeBinary, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -1,20 +1,31 @@
+import asyncio
+import json
+import logging
 from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from services.openai_service import OpenAIService
 from services.interaction_logger import InteractionLogger
-from services.garmin import GarminService
 from services.calendar_service import CalendarService
+from services.agenda import format_free_slots
 from services.tasks_service import TasksService
 from services.chunking_service import ChunkingService
-from handlers.response_utils import send_smart_response, continue_smart_response
+from services.context_service import ContextService
+from services.energy_analytics import energy_analytics
+from handlers.response_utils import send_smart_response, send_streaming_response, continue_smart_response
+from handlers.coalesce_utils import MessageCoalescer
+from config import settings
 from aiogram.types import CallbackQuery
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 router = Router()
 ai_service = OpenAIService()
 interaction_logger = InteractionLogger()
+context_service = ContextService()
+coalescer = MessageCoalescer(settings.COALESCE_WINDOW_SECONDS, settings.COALESCE_MAX_WAIT_SECONDS)
 
 # --- States for Confirmation Loop ---
 class ActionState(StatesGroup):
@@ -29,24 +40,24 @@ async def process_confirmation(message: Message, state: FSMContext):
     if text in ["si", "sí", "confirmar", "dale", "ok", "yes"]:
         if action == "create_event":
             cal = CalendarService()
-            ok = cal.add_event(data['summary'], data['start_time'])
+            ok = await cal.add_event(data['summary'], data['start_time'])
             if ok: await message.answer(f"✅ Agendado: {data['summary']}")
             else: await message.answer("❌ Error al agendar.")
             
         elif action == "delete_event":
             cal = CalendarService()
-            ok = cal.delete_event(data['id'])
+            ok = await cal.delete_event(data['id'])
             if ok: await message.answer(f"🗑️ Evento '{data['summary']}' eliminado.")
             else: await message.answer("❌ Error al eliminar.")
 
         elif action == "create_task":
             tasks = TasksService()
-            ok, msg = tasks.create_task(title=data['summary'], due_date=datetime.fromisoformat(data['start_time']) if data.get('start_time') else None)
+            ok, msg = await tasks.create_task(title=data['summary'], due_date=datetime.fromisoformat(data['start_time']) if data.get('start_time') else None)
             await message.answer(msg)
             
         elif action == "delete_task":
             tasks = TasksService()
-            ok = tasks.delete_task(data['id'], data['list_id'])
+            ok = await tasks.delete_task(data['id'], data['list_id'])
             if ok: await message.answer(f"🗑️ Tarea '{data['summary']}' eliminada.")
             else: await message.answer("❌ Error al eliminar tarea.")
             
@@ -61,24 +72,50 @@ user_histories = {}
 
 @router.message()
 async def chat_handler(message: Message, state: FSMContext):
+    # 0. COALESCING
+    # Bursts within the debounce window run the pipeline once with the merged text;
+    # repeats of a message already being answered are dropped.
+    burst = await coalescer.submit(message.chat.id, message.text)
+    if burst is None:
+        return
+
+    with coalescer.in_flight(message.chat.id, burst):
+        await process_message(message, state, burst.text)
+
+async def process_message(message: Message, state: FSMContext, text: str):
     user_id = message.from_user.id
-    text = message.text
-    
     
-    # 1. TRAFFIC ROUTER (GPT-4o-mini)
-    # Decisions: 'casual', 'management', 'consultant'
-    route_result = await ai_service.route_traffic(text)
+    # 1. LOCAL ROUTER (sub-ms classifier, only answers when confident)
+    # Decisions: 'casual', 'management', 'breakdown', 'consultant'
+    route_result = ai_service.route_local(text)
+    prefetch = None
+
+    if route_result is None:
+        # 2. SPECULATIVE PREFETCH
+        # Warm the consultant context and the Assistant thread while the router decides,
+        # so the router round trip overlaps the fetches instead of coming before them.
+        prefetch = context_service.start()
+        asyncio.create_task(ai_service.warm_thread(user_id))
+
+        # 3. TRAFFIC ROUTER (GPT-4o-mini)
+        route_result = await ai_service.route_traffic(text)
+
     destination = route_result.get("destination", "consultant")
+    route_source = route_result.get("source", "llm")
     
-    print(f"DEBUG: Router Decision: {destination} for '{text}'")
+    logger.info(f"Router decision: {destination} ({route_source}) for '{text}'")
+
+    if prefetch and destination in ("casual", "management", "breakdown"):
+        # Only the consultant (default route) uses the prefetched context
+        context_service.cancel(prefetch)
 
     # --- ROUTE: CASUAL (Cheap) ---
     if destination == "casual":
-        response = await ai_service.casual_chat(text)
-        await message.answer(response)
+        # Streamed: bubbles go out as soon as each paragraph is complete
+        response = await send_streaming_response(message, ai_service.casual_chat_stream(text), state)
         
         # Log Logic (Simplified)
-        interaction_logger.log_interaction(text, response, {"route": "casual"}, user_id)
+        interaction_logger.log_interaction(text, response, {"route": "casual", "route_source": route_source}, user_id)
         return
 
     # --- ROUTE: MANAGEMENT (Calendar/Tasks Actions) ---
@@ -108,7 +145,7 @@ async def chat_handler(message: Message, state: FSMContext):
             # Action: Delete Event
             elif action == "delete_event":
                 cal = CalendarService()
-                event = cal.find_next_event(summary)
+                event = await cal.find_next_event(summary)
                 if event:
                     await state.update_data(action="delete_event", id=event['id'], summary=event['summary'])
                     start_raw = event['start'].get('dateTime', event['start'].get('date'))
@@ -125,16 +162,26 @@ async def chat_handler(message: Message, state: FSMContext):
                 await state.set_state(ActionState.waiting_for_confirmation)
                 return
             
+            # Action: Find Free Slot (computed from busy intervals, no LLM)
+            elif action == "find_slot":
+                duration = int(intent.get('duration_minutes') or 60)
+                slots = await CalendarService().find_free_slots(duration, int(intent.get('days_ahead') or 7))
+                if slots is None:
+                    await message.answer("⚠️ No pude consultar tu calendario.")
+                else:
+                    await message.answer(format_free_slots(slots, duration))
+                return
+
             # Action: Read (Summarize with Casual Chat context)
             elif action in ["read_calendar", "read_tasks"]:
                 context_str = ""
                 if "calendar" in action:
                      cal = CalendarService()
-                     events = cal.get_upcoming_events(7)
+                     events = await cal.get_upcoming_events(7)
                      context_str += f"AGENDA: {events}\n"
                 if "tasks" in action:
                      tasks = TasksService()
-                     t_data = tasks.get_all_tasks()
+                     t_data = await tasks.get_all_tasks()
                      context_str += f"TAREAS: {t_data}\n"
                 
                 # Use Casual Chat to summarize (Cheap)
@@ -158,57 +205,49 @@ async def chat_handler(message: Message, state: FSMContext):
         for step in steps:
             response += f"▫️ {step}\n"
             
-        response += "\n¿Arrancamos con el 1? <<BUTTONS: ¡Dale!, Mejor otra cosa>>"
+        response += "\n¿Arrancamos con el 1? <<BUTTONS: ¡Dale!, Agregar todo a Tasks, Mejor otra cosa>>"
         
+        # Kept for the "Agregar todo a Tasks" button (bulk create)
+        await state.update_data(breakdown_steps=steps, breakdown_task=text[:100])
         await msg_wait.delete()
         await send_smart_response(message, response, state)
-        interaction_logger.log_interaction(text, response, {"route": "breakdown"}, user_id)
+        interaction_logger.log_interaction(text, response, {"route": "breakdown", "route_source": route_source}, user_id)
         return
 
     # --- ROUTE: CONSULTANT (Heavy/Assistant) ---
     # This is for Health, Advice, Deep Analysis, Document Search (RAG)
     else:
-        # Fetch Context (Only if needed)
-        status_parts = []
-        garmin_data = None
-        calendar_events = None
-        tasks_data = None
-
         msg_wait = await message.answer("🧠 **Conectando con el Especialista...**")
 
-        # Heuristic: Check triggers to avoid API calls if obviously not needed? 
-        # Actually, for "Consultant", we assume we need context. But we can be smart.
-        # Let's fetch basic context always for the Assistant to be "aware".
-        
-        # 1. Garmin (Always useful for 'how am I?')
-        try:
-            garmin = GarminService()
-            garmin_data = garmin.get_todays_metrics()
-            status_parts.append("Biometría")
-        except: pass
-        
-        # 2. Calendar (Only if mentioned or broad context needed)
-        # For simplicity/robustness, we fetch it.
-        try:
-            cal = CalendarService()
-            calendar_events = cal.get_upcoming_events(3) # Reduce to 3 days to save tokens?
-            status_parts.append("Agenda")
-        except: pass
+        # Context was prefetched in parallel while routing (or is fetched now if the
+        # local router answered), off the event loop.
+        # Latency is the slowest single source (bounded by its timeout), not the sum.
+        context = await context_service.collect(prefetch) if prefetch else await context_service.gather()
+        garmin_data = context.get("garmin")
+        calendar_events = context.get("calendar")
+        tasks_data = context.get("tasks")
+        # Pre-computed trends/correlations (cached until new data arrives)
+        insights = await energy_analytics.get_insights(user_id)
 
-        # 3. Call Assistant API
-        response = await ai_service.chat(
-            user_input=text, 
-            garmin_data=garmin_data, 
-            calendar_events=calendar_events, 
-            tasks_data=tasks_data, 
-            user_id=user_id
+        # Call Assistant API (streamed)
+        # First bubble is sent as soon as the first paragraph is complete,
+        # instead of waiting for the whole run.
+        response = await send_streaming_response(
+            message,
+            ai_service.chat_stream(
+                user_input=text, 
+                garmin_data=garmin_data, 
+                calendar_events=calendar_events, 
+                tasks_data=tasks_data, 
+                user_id=user_id,
+                insights=insights
+            ),
+            state,
+            placeholder=msg_wait
         )
         
-        await msg_wait.delete()
-        # USE SMART RESPONSE (Consolidacion Rules)
-        await send_smart_response(message, response, state)
-        
-        interaction_logger.log_interaction(text, response, {"route": "consultant"}, user_id)
+        if response: # Empty when a newer message superseded this run
+            interaction_logger.log_interaction(text, response, {"route": "consultant", "route_source": route_source, **context}, user_id)
 
 # --- SMART CALLBACK HANDLERS ---
 @router.callback_query(F.data == "smart_page")
@@ -246,6 +285,18 @@ async def on_smart_action(callback: CallbackQuery, state: FSMContext):
         t = random.choice(tasks)
         await callback.message.answer(f"✨ **Micro-Misión:**\n\n{t}\n\nSi la hacés, ganás.", reply_markup=None)
         
+    elif action.lower() in ["agregar todo a tasks", "agregar a tasks"]:
+        # Breakdown steps -> subtasks of the original task, in one batch request
+        data = await state.get_data()
+        steps = data.get("breakdown_steps")
+        if not steps:
+            await callback.message.answer("⚠️ No encontré los pasos del desglose. Pedímelo de nuevo.")
+        else:
+            count, msg = await TasksService().create_tasks(steps, parent_title=data.get("breakdown_task"))
+            if count:
+                await state.update_data(breakdown_steps=None) # Avoid adding them twice
+            await callback.message.answer(msg)
+        
     elif action.lower() in ["cambiar de tema", "otra cosa"]:
         # Reset context
         await state.clear()
@@ -4,10 +4,13 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from sqlalchemy.future import select
+from config import settings
 from database.db import async_session
 from database.models import CheckIn, User
+from services.openai_service import OpenAIService
 
 router = Router()
+ai_service = OpenAIService()
 
 # --- States ---
 class MorningCheckInOnly(StatesGroup):
@@ -51,9 +54,9 @@ async def start_morning_checkin(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text("⏳ **Conectando con Garmin...**")
     
     # Try to fetch Garmin data
-    from services.garmin import GarminService
-    garmin = GarminService()
-    metrics = garmin.get_todays_metrics()
+    from services.garmin import garmin_metrics
+    # The check-in stores these values: a stale cache waits for a fresh read
+    metrics = await garmin_metrics.get(max_age=settings.GARMIN_METRICS_TTL_SECONDS)
     
     if metrics and metrics.get("body_battery") is not None:
         bb = metrics["body_battery"]
@@ -66,6 +69,9 @@ async def start_morning_checkin(callback: CallbackQuery, state: FSMContext):
         # --- GENERAR PANORAMA FÍSICO ---
         # Interpretación cualitativa en lugar de dato crudo
         intro = f"☀️ **Hola Ariel, analicé tu estado físico:**\n\n"
+        if metrics["age_minutes"] * 60 > settings.GARMIN_METRICS_TTL_SECONDS:
+            # Garmin did not answer: say how old the reading is
+            intro += f"_(Datos de Garmin de las {metrics['fetched_at']}, hace {metrics['age_minutes']} min)_\n\n"
         
         if bb >= 75:
             panorama = "� **Motor al 100%.**\nTu cuerpo recuperó bárbaro. Tenés nafta para encarar las cosas difíciles que venís pateando. Es un día para aprovechar."
@@ -183,9 +189,6 @@ async def process_interoception(message: Message, state: FSMContext):
         await session.commit()
     
     # Analyze with OpenAI
-    from services.openai_service import OpenAIService
-    ai = OpenAIService()
-    
     context = {
         "body_battery": data.get('body_battery'),
         "sleep_score": data.get('sleep_score'),
@@ -196,7 +199,7 @@ async def process_interoception(message: Message, state: FSMContext):
     # Show "Thinking..." status
     processing_msg = await message.answer("🤔 Analizando...")
     
-    ai_response = await ai.analyze_checkin(context, text)
+    ai_response = await ai_service.analyze_checkin(context, text)
     
     # Fetch KPIs
     from services.analytics_service import AnalyticsService
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+from services.text_utils import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+class _Burst:
+    __slots__ = ("texts", "keys", "started", "deadline")
+
+    def __init__(self, text: str, key: str, now: float, window: float):
+        self.texts = [text]
+        self.keys = {key}
+        self.started = now
+        self.deadline = now + window
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.texts)
+
+
+class MessageCoalescer:
+    """
+    Per-chat inbound buffer in front of chat_handler.
+    - Messages arriving within the debounce window are merged into one pipeline run.
+    - A repeat of a message that is already being answered is dropped
+      (the in-flight response covers it).
+    Works because aiogram handles every update as its own task.
+    """
+
+    def __init__(self, window: float, max_wait: float):
+        self.window = window
+        self.max_wait = max_wait
+        self._bursts = {}     # chat_id -> _Burst still collecting
+        self._in_flight = {}  # chat_id -> {normalized text: runs answering it}
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return normalize_text(text) or (text or "")
+
+    async def submit(self, chat_id: int, text: str):
+        """
+        Returns the burst to process, or None when this message was folded
+        into another run (the caller should just return).
+        """
+        key = self._key(text)
+        if key in self._in_flight.get(chat_id, {}):
+            logger.info(f"Coalesced repeat for chat {chat_id}: already answering '{text}'")
+            return None
+
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+
+        burst = self._bursts.get(chat_id)
+        if burst is not None:
+            # Join the burst being collected and push its deadline (bounded by max_wait)
+            if key not in burst.keys:
+                burst.texts.append(text)
+                burst.keys.add(key)
+            burst.deadline = min(now + self.window, burst.started + self.max_wait)
+            return None
+
+        burst = _Burst(text, key, now, self.window)
+        if self.window <= 0:
+            return burst
+
+        self._bursts[chat_id] = burst
+        try:
+            while (delay := burst.deadline - loop.time()) > 0:
+                await asyncio.sleep(delay)
+        finally:
+            del self._bursts[chat_id]
+
+        if len(burst.texts) > 1:
+            logger.info(f"Coalesced {len(burst.texts)} messages for chat {chat_id}")
+        return burst
+
+    @contextmanager
+    def in_flight(self, chat_id: int, burst: _Burst):
+        """Marks the burst's texts as being answered while the pipeline runs."""
+        running = self._in_flight.setdefault(chat_id, {})
+        for key in burst.keys:
+            running[key] = running.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            for key in burst.keys:
+                running[key] -= 1
+                if not running[key]:
+                    del running[key]
+            if not running:
+                self._in_flight.pop(chat_id, None)
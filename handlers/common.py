@@ -1,6 +1,9 @@
 from aiogram import Router
 from aiogram.filters import Command
 from aiogram.types import Message
+from config import settings
+from services.route_cache import route_cache
+from services.garmin import session_stats as garmin_session_stats
 
 router = Router()
 
@@ -11,3 +14,27 @@ async def cmd_start(message: Message):
 @router.message(Command("help"))
 async def cmd_help(message: Message):
     await message.answer("Comandos disponibles:\n/start - Iniciar\n/checkin - Registrar estado")
+
+@router.message(Command("routerstats"))
+async def cmd_router_stats(message: Message):
+    if message.from_user.id not in settings.ADMIN_IDS:
+        return
+    s = route_cache.stats()
+    await message.answer(
+        "🧭 **Caché del Router**\n\n"
+        f"Entradas: {s['entries']}\n"
+        f"Hits: {s['hits']} | Misses: {s['misses']} ({s['hit_rate']:.0%})\n"
+        f"Latencia media router: {s['avg_router_seconds']:.2f}s\n"
+        f"Ahorro estimado: {s['saved_seconds']:.1f}s | US${s['saved_usd']:.4f}"
+    )
+
+@router.message(Command("garminstats"))
+async def cmd_garmin_stats(message: Message):
+    if message.from_user.id not in settings.ADMIN_IDS:
+        return
+    s = garmin_session_stats
+    await message.answer(
+        "⌚ **Sesión de Garmin**\n\n"
+        f"Logins completos: {s['logins']} (fallidos: {s['login_failures']})\n"
+        f"Sesiones reanudadas: {s['resumes']}"
+    )
@@ -6,6 +6,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 from handlers.timer_utils import TimerManager
+from services.openai_service import RunSuperseded
 
 class ResponseSplitter:
     MAX_BUBBLES_PER_BATCH = 3 
@@ -59,6 +60,49 @@ class ResponseSplitter:
     def get_batch(bubbles: List[str]) -> Tuple[List[str], List[str]]:
         return bubbles[:ResponseSplitter.MAX_BUBBLES_PER_BATCH], bubbles[ResponseSplitter.MAX_BUBBLES_PER_BATCH:]
 
+class IncrementalSplitter:
+    """
+    Streaming counterpart of ResponseSplitter.split_text.
+    feed() receives raw deltas and returns the bubbles of every paragraph that is
+    already complete ("\n\n" seen); finish() flushes the rest.
+    <<TIMER>> / <<BUTTONS>> tags are pulled out as they close and applied at the end.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.full_text = ""
+        self.button_def = None
+        self.timer = None # (minutes, label)
+
+    def _process(self, paragraph: str) -> List[str]:
+        paragraph, t_mins, t_label = TimerManager.parse_timer_tag(paragraph)
+        if t_mins and t_label:
+            self.timer = (t_mins, t_label)
+        paragraph, button_def = ResponseSplitter.extract_buttons(paragraph)
+        if button_def:
+            self.button_def = button_def
+        return ResponseSplitter.split_text(paragraph)
+
+    def feed(self, delta: str) -> List[str]:
+        self.buffer += delta
+        self.full_text += delta
+        bubbles = []
+        while True:
+            cut = self.buffer.find("\n\n")
+            if cut == -1:
+                break
+            paragraph = self.buffer[:cut]
+            # Don't cut through a tag that is still open (<<BUTTONS: a,\n\n b>>)
+            if paragraph.count("<<") > paragraph.count(">>"):
+                break
+            self.buffer = self.buffer[cut + 2:]
+            bubbles.extend(self._process(paragraph))
+        return bubbles
+
+    def finish(self) -> List[str]:
+        paragraph, self.buffer = self.buffer, ""
+        return self._process(paragraph)
+
 async def send_smart_response(message_or_callback: Any, text: str, state: FSMContext) -> None:
     """
     Main entry point for sending responses with Consolidacion Rules.
@@ -147,3 +191,60 @@ async def continue_smart_response(callback: CallbackQuery, state: FSMContext):
         is_last = (i == len(current_batch) - 1)
         reply = keyboard if is_last else None
         await callback.message.answer(bubble, reply_markup=reply)
+
+async def send_streaming_response(message: Message, chunks, state: FSMContext, placeholder: Message = None) -> str:
+    """
+    Streaming version of send_smart_response.
+    Sends each bubble as soon as its paragraph is complete (up to MAX_BUBBLES_PER_BATCH),
+    keeps the rest for "Leer más", and attaches the final keyboard to the last bubble sent.
+    'placeholder' (e.g. "Conectando...") is deleted when the first bubble goes out.
+    Returns the full raw text (for logging), or "" when the run was superseded:
+    then nothing more is sent, the buffered text is dropped and the FSM state is left alone.
+    """
+    splitter = IncrementalSplitter()
+    sent = []
+    remaining = []
+
+    async def emit(bubbles):
+        nonlocal placeholder
+        for bubble in bubbles:
+            if len(sent) < ResponseSplitter.MAX_BUBBLES_PER_BATCH:
+                if placeholder:
+                    await placeholder.delete()
+                    placeholder = None
+                sent.append(await message.answer(bubble))
+            else:
+                remaining.append(bubble)
+
+    try:
+        async for delta in chunks:
+            await emit(splitter.feed(delta))
+    except RunSuperseded:
+        if placeholder:
+            await placeholder.delete()
+        return ""
+    await emit(splitter.finish())
+
+    if placeholder:
+        await placeholder.delete()
+
+    # Trigger Timer if found (Fire and Forget)
+    if splitter.timer:
+        import asyncio
+        t_mins, t_label = splitter.timer
+        asyncio.create_task(TimerManager.set_timer(message.chat.id, t_mins, t_label, message.bot))
+
+    # Determine Keyboard (same rules as send_smart_response)
+    if remaining:
+        builder = InlineKeyboardBuilder()
+        builder.button(text="... Leer más ⬇️", callback_data="smart_page")
+        keyboard = builder.as_markup()
+        await state.update_data(smart_remaining=remaining, smart_final_buttons=splitter.button_def)
+    else:
+        keyboard = ResponseSplitter.create_keyboard_from_def(splitter.button_def)
+        await state.update_data(smart_remaining=[], smart_final_buttons=None)
+
+    if keyboard and sent:
+        await sent[-1].edit_reply_markup(reply_markup=keyboard)
+
+    return splitter.full_text
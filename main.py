@@ -6,6 +6,13 @@ from aiohttp import web
 from aiogram import Bot, Dispatcher
 from config import settings
 from database.db import init_db
+from services.route_cache import route_cache
+from services.google_clients import google_clients
+from services.calendar_mirror import calendar_mirror
+from services.tasks_mirror import tasks_mirror
+from services.garmin import garmin_metrics
+from services.energy_ingest import energy_ingest
+from services.scheduler import scheduler
 from handlers import common, checkin, emergency, chat
 
 # 1. Dummy Web Server (Render Requirement)
@@ -35,6 +42,25 @@ async def main():
     logger.info("🚀 Starting JARVISZ on Render (Clean Build)...")
     
     await init_db()
+    await route_cache.load()
+
+    # Google Calendar/Tasks: load credentials once, keep tokens fresh in the background
+    await google_clients.start()
+
+    # Local calendar/tasks mirrors: restore from SQLite, then keep them current with incremental sync
+    await calendar_mirror.load()
+    asyncio.create_task(calendar_mirror.refresh_loop())
+    await tasks_mirror.load()
+    asyncio.create_task(tasks_mirror.refresh_loop())
+
+    # Garmin: today's metrics kept warm, history ingested into EnergyLog (background jobs)
+    garmin_metrics.start()
+    energy_ingest.start()
+    scheduler.start()
+
+    # Static Assistant instructions: report drift vs system_prompt_specialist.md (and sync)
+    report = await chat.ai_service.sync_instructions()
+    logger.info(f"📜 Assistant instructions: {report}")
     
     # Start Web Server for Render
     await start_web_server()
@@ -56,7 +82,11 @@ async def main():
     dp.include_router(chat.router)
     
     logger.info("📡 Polling started...")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        scheduler.shutdown(wait=False)
+        await google_clients.close()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,174 @@
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+TZ = ZoneInfo("America/Argentina/Buenos_Aires")
+
+# Helper for Spanish months/days
+MONTHS_ES = {1:"ENE", 2:"FEB", 3:"MAR", 4:"ABR", 5:"MAY", 6:"JUN", 7:"JUL", 8:"AGO", 9:"SEP", 10:"OCT", 11:"NOV", 12:"DIC"}
+DAYS_ES = {0:"LUN", 1:"MAR", 2:"MIÉ", 3:"JUE", 4:"VIE", 5:"SÁB", 6:"DOM"}
+
+
+class AgendaEvent:
+    """Typed, compact calendar event. start/end are aware datetimes in TZ (end exclusive)."""
+
+    __slots__ = ("id", "calendar", "summary", "start", "end", "all_day", "busy")
+
+    def __init__(self, id: str, calendar, summary: str, start: datetime, end: datetime, all_day: bool, busy: bool = True):
+        self.id = id
+        self.calendar = calendar
+        self.summary = summary
+        self.start = start
+        self.end = end
+        self.all_day = all_day
+        self.busy = busy # False for events marked "Disponible" (transparent)
+
+    @classmethod
+    def from_api(cls, event: dict, calendar=None):
+        """From a Calendar API event. All-day events span local midnights."""
+        start, end = event['start'], event['end']
+        if 'date' in start:
+            s = datetime.strptime(start['date'], "%Y-%m-%d").replace(tzinfo=TZ)
+            e = datetime.strptime(end['date'], "%Y-%m-%d").replace(tzinfo=TZ)
+            all_day = True
+        else:
+            s = datetime.fromisoformat(start['dateTime'].replace('Z', '+00:00'))
+            e = datetime.fromisoformat(end['dateTime'].replace('Z', '+00:00'))
+            s = s.replace(tzinfo=TZ) if s.tzinfo is None else s.astimezone(TZ)
+            e = e.replace(tzinfo=TZ) if e.tzinfo is None else e.astimezone(TZ)
+            all_day = False
+        busy = event.get('transparency') != 'transparent'
+        return cls(event['id'], calendar, event.get('summary', 'Sin título'), s, e, all_day, busy)
+
+    @property
+    def fingerprint(self) -> tuple:
+        return (self.id, self.summary, self.start, self.end, self.all_day)
+
+    def days(self, first_day: date = None, last_day: date = None):
+        """
+        Every local date this event touches, clamped to [first_day, last_day]
+        (an end at exactly 00:00 does not touch that day).
+        """
+        first = self.start.date()
+        last = max(first, (self.end - timedelta(microseconds=1)).date())
+        if first_day: first = max(first, first_day)
+        if last_day: last = min(last, last_day)
+        d = first
+        while d <= last:
+            yield d
+            d += timedelta(days=1)
+
+    def line_for(self, day: date):
+        """(sort_key, line) for one day of the event. Timed events crossing midnight are clipped per day."""
+        if self.all_day:
+            # 🔵 Todo el día | Título
+            return "00:00", f"🔵 Todo el día | {self.summary}"
+        first, last = self.start.date(), (self.end - timedelta(microseconds=1)).date()
+        if first < day < last:
+            return "00:00", f"🔵 Todo el día | {self.summary}"
+        start_str = self.start.strftime("%H:%M") if day == first else "00:00"
+        end_str = self.end.strftime("%H:%M") if self.end.date() == day else "24:00"
+        # 🔵 07:00 - 15:00 | Título
+        return start_str, f"🔵 {start_str} - {end_str} | {self.summary}"
+
+
+class AgendaRenderer:
+    """
+    Builds the Agenda View text one day at a time.
+    Each rendered day is cached under the fingerprint of its events, so any
+    window (3, 7, 30 days) is assembled from cached days and only the days
+    whose events changed are formatted again.
+    """
+
+    def __init__(self):
+        self.days = {} # date -> (fingerprint, rendered lines)
+
+    def _render_day(self, day: date, events: list) -> list:
+        lines = [f"🗓 **{day.day} {MONTHS_ES[day.month]}, {DAYS_ES[day.weekday()]}**"]
+        # Sort by time
+        lines += [line for _, line in sorted((e.line_for(day) for e in events), key=lambda x: x[0])]
+        lines.append("") # Spacer
+        return lines
+
+    def render(self, events: list, first_day: date, last_day: date) -> str:
+        # Bucket Logic (The "Explosion"): an event appears in every day it touches
+        buckets = {}
+        for event in events:
+            for day in event.days(first_day, last_day):
+                buckets.setdefault(day, []).append(event)
+
+        output_lines = []
+        for day in sorted(buckets):
+            day_events = buckets[day]
+            fingerprint = tuple(sorted(e.fingerprint for e in day_events))
+            cached = self.days.get(day)
+            if cached is None or cached[0] != fingerprint:
+                cached = (fingerprint, self._render_day(day, day_events))
+                self.days[day] = cached
+            output_lines.extend(cached[1])
+
+        # Past days are never asked for again
+        today = datetime.now(TZ).date()
+        for day in [d for d in self.days if d < today]:
+            del self.days[day]
+
+        if not output_lines:
+            return "No hay eventos próximos."
+        return "\n".join(output_lines)
+
+
+agenda_renderer = AgendaRenderer()
+
+
+# --- Free Slots ---
+
+def merge_intervals(intervals: list) -> list:
+    """Sorts and merges overlapping/touching (start, end) intervals."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def _round_up(dt: datetime, minutes: int = 15) -> datetime:
+    """Next quarter hour (slots start at :00/:15/:30/:45)."""
+    floor = dt.replace(minute=dt.minute - dt.minute % minutes, second=0, microsecond=0)
+    return floor if floor == dt else floor + timedelta(minutes=minutes)
+
+
+def free_slots(busy: list, start: datetime, end: datetime, duration: timedelta,
+               work_start: int, work_end: int, work_days: list, limit: int = 5) -> list:
+    """
+    Free windows [(start, end)] of at least `duration` inside working hours,
+    between start and end, soonest first. `busy` must be merged (merge_intervals).
+    """
+    slots = []
+    day = start.astimezone(TZ).date()
+    while day <= end.astimezone(TZ).date() and len(slots) < limit:
+        if day.weekday() in work_days:
+            cursor = _round_up(max(start, datetime.combine(day, time(work_start), TZ)))
+            window_end = min(end, datetime.combine(day, time(work_end), TZ))
+            for busy_start, busy_end in busy:
+                if busy_end <= cursor:
+                    continue
+                if busy_start >= window_end:
+                    break
+                if busy_start - cursor >= duration:
+                    slots.append((cursor, busy_start))
+                cursor = _round_up(max(cursor, busy_end))
+            if window_end - cursor >= duration:
+                slots.append((cursor, window_end))
+        day += timedelta(days=1)
+    return slots[:limit]
+
+
+def format_free_slots(slots: list, duration_minutes: int) -> str:
+    if not slots:
+        return f"😕 No encontré huecos de {duration_minutes} min en tu horario laboral."
+    lines = [f"🟢 **Huecos libres ({duration_minutes} min o más):**", ""]
+    for start, end in slots:
+        d = start.date()
+        lines.append(f"🗓 {DAYS_ES[d.weekday()]} {d.day} {MONTHS_ES[d.month]}: {start:%H:%M} - {end:%H:%M}")
+    return "\n".join(lines)
@@ -0,0 +1,109 @@
+import zlib
+from datetime import date, datetime
+import numpy as np
+from sqlalchemy import select
+from database.db import async_session
+from database.models import BiometricDay
+from services.agenda import TZ
+
+SERIES = ("body_battery", "stress")
+
+_NO_POINTS = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int16))
+
+
+def _day_start(day: date) -> int:
+    """Epoch seconds of local midnight."""
+    return int(datetime(day.year, day.month, day.day, tzinfo=TZ).timestamp())
+
+
+def encode_series(day: date, epochs: np.ndarray, values: np.ndarray) -> bytes:
+    """
+    Blob for one day: n int32 time deltas (seconds; the first is from local
+    midnight) followed by n int8 value deltas (levels are 0-100), zlib-compressed.
+    Regular 3-minute samples make the deltas repeat, so a day packs into a few hundred bytes.
+    """
+    times = np.asarray(epochs, dtype=np.int64) - _day_start(day)
+    levels = np.clip(np.asarray(values, dtype=np.int16), 0, 100)
+    time_deltas = np.diff(times, prepend=0).astype(np.int32)
+    value_deltas = np.diff(levels, prepend=0).astype(np.int8)
+    return zlib.compress(time_deltas.tobytes() + value_deltas.tobytes())
+
+
+def decode_series(day: date, blob: bytes):
+    """(epoch seconds int64, levels int16) of one day."""
+    raw = zlib.decompress(blob)
+    n = len(raw) // 5
+    times = np.cumsum(np.frombuffer(raw, dtype=np.int32, count=n), dtype=np.int64) + _day_start(day)
+    levels = np.cumsum(np.frombuffer(raw, dtype=np.int8, offset=4 * n), dtype=np.int16)
+    return times, levels
+
+
+def merge_series(old, new):
+    """Union of two (epochs, levels) series by timestamp, sorted; `new` wins on duplicates."""
+    times = np.concatenate([new[0], old[0]])
+    levels = np.concatenate([new[1], old[1]])
+    times, first = np.unique(times, return_index=True)
+    return times, levels[first]
+
+
+class BiometricStore:
+    """
+    Intraday Garmin series (body battery, stress) stored as one BiometricDay row per
+    user per day instead of one EnergyLog row per point. Range reads are a single
+    query whose blobs are decoded straight into NumPy arrays.
+    """
+
+    async def put_days(self, user_id: int, days: dict) -> int:
+        """
+        Upserts {day: {series: (epochs, levels)}} in one transaction, merging with
+        the points already stored (re-ingesting a day is idempotent). Returns points written.
+        """
+        if not days:
+            return 0
+        written = 0
+        async with async_session() as session:
+            rows = (await session.execute(
+                select(BiometricDay)
+                .where(BiometricDay.user_id == user_id)
+                .where(BiometricDay.day.in_(list(days)))
+            )).scalars().all()
+            existing = {row.day: row for row in rows}
+
+            for day, series in days.items():
+                row = existing.get(day) or BiometricDay(user_id=user_id, day=day)
+                for name, (epochs, levels) in series.items():
+                    points = (np.asarray(epochs, dtype=np.int64), np.asarray(levels, dtype=np.int16))
+                    blob = getattr(row, name)
+                    points = merge_series(decode_series(day, blob) if blob else _NO_POINTS, points)
+                    setattr(row, name, encode_series(day, *points))
+                    written += len(points[0])
+                row.updated_at = datetime.utcnow()
+                session.add(row)
+            await session.commit()
+        return written
+
+    async def load(self, user_id: int, start: date, end: date, series: str = "body_battery"):
+        """
+        One series over [start, end]: (timestamps as datetime64[s] UTC, levels int16),
+        sorted. One query, no per-point Python objects.
+        """
+        if series not in SERIES:
+            raise ValueError(f"Unknown series: {series}")
+        column = getattr(BiometricDay, series)
+        async with async_session() as session:
+            rows = (await session.execute(
+                select(BiometricDay.day, column)
+                .where(BiometricDay.user_id == user_id)
+                .where(BiometricDay.day >= start, BiometricDay.day <= end)
+                .where(column.is_not(None))
+                .order_by(BiometricDay.day)
+            )).all()
+        if not rows:
+            return _NO_POINTS[0].astype("datetime64[s]"), _NO_POINTS[1]
+        decoded = [decode_series(day, blob) for day, blob in rows]
+        times = np.concatenate([d[0] for d in decoded]).astype("datetime64[s]")
+        levels = np.concatenate([d[1] for d in decoded])
+        return times, levels
+
+
+biometric_store = BiometricStore()
@@ -0,0 +1,257 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from urllib.parse import quote
+from sqlalchemy import delete, select
+from config import settings
+from database.db import async_session
+from database.models import CalendarMirrorEvent, CalendarSyncState
+from services.google_clients import GoogleAPIError
+from services.fuzzy_index import FuzzyIndex
+from services.agenda import AgendaEvent, TZ
+
+logger = logging.getLogger(__name__)
+
+
+class CalendarMirror:
+    """
+    Local copy of every subscribed calendar, kept current with the Calendar
+    incremental sync protocol:
+    - First download (and once every CALENDAR_MIRROR_FULL_RESYNC_HOURS) is a full
+      events.list over [-CALENDAR_MIRROR_PAST_DAYS, +CALENDAR_MIRROR_FUTURE_DAYS]
+      that returns a nextSyncToken. The window must be bounded: recurring events
+      are expanded into instances, and an endless series would never finish.
+    - Every refresh after that sends only the syncToken and gets only the changes.
+    - 410 Gone (token expired) -> drop the calendar and download it again.
+    Reads are answered from memory; SQLite keeps events and tokens across restarts.
+    """
+
+    def __init__(self):
+        self.events = {}    # calendar_id -> {event_id: event dict}
+        self.items = {}     # (calendar_id, event_id) -> AgendaEvent
+        self.calendars = {} # calendar_id -> CalendarSyncState
+        self.synced_at = None # Last complete refresh of every calendar (naive UTC)
+        self.index = FuzzyIndex() # (calendar_id, event_id) over summaries
+        self._sync_lock = asyncio.Lock()
+
+    # --- Reads ---
+    def is_fresh(self) -> bool:
+        """True when reads can skip Google (last full refresh within the staleness bound)."""
+        if self.synced_at is None:
+            return False
+        age = (datetime.utcnow() - self.synced_at).total_seconds()
+        return age <= settings.CALENDAR_MIRROR_MAX_STALENESS_SECONDS
+
+    def primary_id(self):
+        return next((cal_id for cal_id, state in self.calendars.items() if state.is_primary), None)
+
+    def events_between(self, start: datetime, end: datetime, calendar_id: str = None) -> list:
+        """AgendaEvents overlapping [start, end), sorted by start."""
+        found = [
+            item for (cal_id, _), item in self.items.items()
+            if (calendar_id is None or cal_id == calendar_id) and item.start < end and item.end > start
+        ]
+        found.sort(key=lambda item: item.start)
+        return found
+
+    def search(self, query: str, after: datetime, calendar_id: str = None) -> list:
+        """
+        Events matching query (fuzzy) that have not ended by `after`, over the whole
+        mirrored horizon. Best match first, then soonest.
+        """
+        found = []
+        for score, (cal_id, event_id) in self.index.search(query):
+            if calendar_id and cal_id != calendar_id:
+                continue
+            item = self.items[(cal_id, event_id)]
+            if item.end > after:
+                found.append((-round(score, 2), item.start, self.events[cal_id][event_id]))
+        found.sort(key=lambda x: (x[0], x[1]))
+        return [event for _, _, event in found]
+
+    # --- Local Changes ---
+    def _put(self, cal_id: str, event: dict, cal_name: str = None):
+        if cal_name is None and cal_id in self.calendars:
+            cal_name = self.calendars[cal_id].summary
+        try:
+            item = AgendaEvent.from_api(event, cal_name)
+        except (KeyError, ValueError):
+            return False
+        self.events.setdefault(cal_id, {})[event['id']] = event
+        self.items[(cal_id, event['id'])] = item
+        self.index.add((cal_id, event['id']), event.get('summary', ''))
+        return True
+
+    def _drop(self, cal_id: str, event_id: str):
+        self.events.get(cal_id, {}).pop(event_id, None)
+        self.items.pop((cal_id, event_id), None)
+        self.index.remove((cal_id, event_id))
+
+    def _drop_calendar(self, cal_id: str):
+        for event_id in list(self.events.get(cal_id, {})):
+            self._drop(cal_id, event_id)
+        self.events.pop(cal_id, None)
+
+    async def apply_local(self, event: dict, deleted: bool = False):
+        """
+        Mirrors our own mutations on the primary calendar right away
+        (the next incremental sync confirms them).
+        """
+        cal_id = self.primary_id()
+        if cal_id is None:
+            return
+        if deleted:
+            self._drop(cal_id, event['id'])
+        else:
+            self._put(cal_id, event)
+        await self._persist(cal_id, changed=[] if deleted else [event], removed=[event['id']] if deleted else [])
+
+    # --- Sync ---
+    async def _list_pages(self, client, cal_id: str, params: dict):
+        """Walks every page of events.list. Returns (items, nextSyncToken)."""
+        items, page_token = [], None
+        while True:
+            res = await client.get(
+                f"/calendars/{quote(cal_id, safe='')}/events",
+                pageToken=page_token, maxResults=2500, **params
+            )
+            items.extend(res.get('items', []))
+            page_token = res.get('nextPageToken')
+            if not page_token:
+                return items, res.get('nextSyncToken')
+
+    async def _sync_calendar(self, client, cal: dict):
+        cal_id = cal['id']
+        state = self.calendars.get(cal_id) or CalendarSyncState(calendar_id=cal_id)
+        state.summary = cal.get('summary')
+        state.is_primary = bool(cal.get('primary'))
+        now = datetime.utcnow()
+
+        full_due = (
+            not state.sync_token
+            or state.full_synced_at is None
+            or now - state.full_synced_at > timedelta(hours=settings.CALENDAR_MIRROR_FULL_RESYNC_HOURS)
+        )
+        full = full_due
+        if not full_due:
+            try:
+                items, token = await self._list_pages(client, cal_id, {"syncToken": state.sync_token, "singleEvents": True})
+            except GoogleAPIError as e:
+                if e.status != 410:
+                    raise
+                logger.info(f"Calendar mirror: sync token expired for {state.summary}, full resync")
+                full = True
+
+        if full:
+            # The window moves forward with each full download (old events fall out)
+            local_now = datetime.now(TZ)
+            window = {
+                "timeMin": (local_now - timedelta(days=settings.CALENDAR_MIRROR_PAST_DAYS)).isoformat(),
+                "timeMax": (local_now + timedelta(days=settings.CALENDAR_MIRROR_FUTURE_DAYS)).isoformat(),
+            }
+            items, token = await self._list_pages(client, cal_id, {**window, "singleEvents": True})
+            self._drop_calendar(cal_id)
+            state.full_synced_at = now
+
+        changed, removed = [], []
+        for event in items:
+            if event.get('status') == 'cancelled':
+                self._drop(cal_id, event['id'])
+                removed.append(event['id'])
+            elif self._put(cal_id, event, state.summary):
+                changed.append(event)
+
+        state.sync_token = token
+        state.synced_at = now
+        self.calendars[cal_id] = state
+        self.events.setdefault(cal_id, {})
+        await self._persist(cal_id, changed, removed, state=state, replace=full)
+        if items:
+            logger.info(f"Calendar mirror: {state.summary} {'full' if full else 'delta'} "
+                        f"+{len(changed)} -{len(removed)}")
+
+    async def sync(self):
+        """Brings every subscribed calendar up to date (only changes, after the first run)."""
+        from services.calendar_service import CalendarService
+        async with self._sync_lock:
+            cal_service = CalendarService()
+            if not await cal_service.authenticate():
+                return False
+            started = datetime.utcnow()
+            calendars = await cal_service.get_calendars()
+
+            semaphore = asyncio.Semaphore(settings.CALENDAR_FANOUT_CONCURRENCY)
+
+            async def run(cal):
+                async with semaphore:
+                    try:
+                        await self._sync_calendar(cal_service.service, cal)
+                        return True
+                    except Exception as e:
+                        logger.error(f"Calendar mirror sync failed for {cal.get('summary')}: {e}")
+                        return False
+
+            results = await asyncio.gather(*(run(cal) for cal in calendars))
+
+            # Unsubscribed calendars
+            subscribed = {cal['id'] for cal in calendars}
+            for cal_id in [c for c in self.calendars if c not in subscribed]:
+                self._drop_calendar(cal_id)
+                del self.calendars[cal_id]
+                await self._persist(cal_id, [], [], replace=True, forget=True)
+
+            if all(results):
+                self.synced_at = started
+            return all(results)
+
+    async def refresh_loop(self):
+        """Background task: pulls changes every CALENDAR_SYNC_INTERVAL_SECONDS."""
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Calendar mirror refresh failed: {e}")
+            await asyncio.sleep(settings.CALENDAR_SYNC_INTERVAL_SECONDS)
+
+    # --- Persistence ---
+    async def _persist(self, cal_id: str, changed: list, removed: list, state=None, replace=False, forget=False):
+        try:
+            async with async_session() as session:
+                if replace:
+                    await session.execute(delete(CalendarMirrorEvent).where(CalendarMirrorEvent.calendar_id == cal_id))
+                elif removed:
+                    await session.execute(delete(CalendarMirrorEvent).where(
+                        CalendarMirrorEvent.calendar_id == cal_id, CalendarMirrorEvent.event_id.in_(removed)
+                    ))
+                for event in changed:
+                    await session.merge(CalendarMirrorEvent(
+                        calendar_id=cal_id, event_id=event['id'], data=json.dumps(event, ensure_ascii=False)
+                    ))
+                if forget:
+                    await session.execute(delete(CalendarSyncState).where(CalendarSyncState.calendar_id == cal_id))
+                elif state is not None:
+                    await session.merge(state)
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Calendar mirror persist error: {e}")
+
+    async def load(self):
+        """Loads events and sync tokens from SQLite (call once at startup)."""
+        try:
+            async with async_session() as session:
+                states = (await session.execute(select(CalendarSyncState))).scalars().all()
+                rows = (await session.execute(select(CalendarMirrorEvent))).scalars().all()
+            for state in states:
+                self.calendars[state.calendar_id] = state
+                self.events.setdefault(state.calendar_id, {})
+            for row in rows:
+                self._put(row.calendar_id, json.loads(row.data))
+            if states and all(state.synced_at for state in states):
+                self.synced_at = min(state.synced_at for state in states)
+            logger.info(f"Calendar mirror loaded: {len(states)} calendars, {len(rows)} events")
+        except Exception as e:
+            logger.error(f"Calendar mirror load error: {e}")
+
+
+calendar_mirror = CalendarMirror()
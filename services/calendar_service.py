@@ -1,126 +1,65 @@
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-import os.path
+import asyncio
 import logging
+import time
+from urllib.parse import quote
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
+from services.google_clients import google_clients, GoogleAPIError
+from services.calendar_mirror import calendar_mirror
+from services.agenda import AgendaEvent, agenda_renderer, merge_intervals, free_slots
+from config import settings
 logger = logging.getLogger(__name__)
 
-# If modifying these scopes, delete the file token.json.
-SCOPES = ['https://www.googleapis.com/auth/calendar']
+# calendarList almost never changes: cached for every CalendarService instance
+_calendar_list = {"items": None, "fetched_at": 0.0}
 
 class CalendarService:
     def __init__(self):
-        self.creds = None
         self.service = None
-        
-    def authenticate(self):
-        """Shows basic usage of the Google Calendar API."""
-        # Calculate absolute paths
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        token_path = os.path.join(base_dir, 'token.json')
-        creds_path = os.path.join(base_dir, 'credentials.json')
-
-        logger.info(f"Authenticating Calendar Service. Token path: {token_path}, Creds path: {creds_path}")
 
-        # 1. Try Environment Variables (Priority for Server)
-        env_token_json = os.environ.get('GOOGLE_TOKEN_JSON')
-        env_creds_json = os.environ.get('GOOGLE_CREDENTIALS_JSON')
+    async def authenticate(self):
+        """Attaches the shared Calendar client (async, keep-alive, built once per process)."""
+        client = google_clients.get("calendar")
+        if not await client.ensure_credentials():
+            return False
+        self.service = client
+        return True
 
-        if env_token_json:
-            try:
-                import json
-                info = json.loads(env_token_json)
-                self.creds = Credentials.from_authorized_user_info(info, SCOPES)
-                logger.info("Loaded Calendar credentials from GOOGLE_TOKEN_JSON env var.")
-            except Exception as e:
-                logger.error(f"Failed to load token from env var: {e}")
-                self.creds = None
+    async def get_calendars(self, force=False):
+        """Subscribed calendars (calendarList), cached for CALENDAR_LIST_TTL_SECONDS."""
+        age = time.monotonic() - _calendar_list["fetched_at"]
+        if force or _calendar_list["items"] is None or age > settings.CALENDAR_LIST_TTL_SECONDS:
+            cal_list = await self.service.get("/users/me/calendarList")
+            _calendar_list["items"] = cal_list.get('items', [])
+            _calendar_list["fetched_at"] = time.monotonic()
+        return _calendar_list["items"]
 
-        # 2. Try Local File (Fallback for Local Dev)
-        if not self.creds and os.path.exists(token_path):
+    async def _list_calendar_events(self, cal, semaphore, **params):
+        """events.list for one calendar, tagged with its name. [] on error."""
+        async with semaphore:
             try:
-                self.creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-                logger.info("Loaded Calendar credentials from local file.")
-            except Exception as e:
-                logger.error(f"Failed to load token from file: {e}")
-                self.creds = None
-        
-        # If there are no (valid) credentials available, let the user log in.
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                try:
-                    self.creds.refresh(Request())
-                    logger.info("Refreshed Calendar token.")
-                except Exception as e:
-                    logger.error(f"Error refreshing token: {e}")
-                    self.creds = None
-            
-            if not self.creds:
-                # Try to get client config from Env Var or File
-                client_config = None
-                
-                if env_creds_json:
-                     try:
-                        import json
-                        client_config = json.loads(env_creds_json)
-                        logger.info("Loaded Client Config from GOOGLE_CREDENTIALS_JSON env var.")
-                     except Exception as e:
-                        logger.error(f"Failed to parse creds env var: {e}")
-
-                if not client_config and os.path.exists(creds_path):
-                     logger.info(f"Loading Client Config from file: {creds_path}")
-                     # let InstalledAppFlow handle the file path directly or read it here.
-                     # InstalledAppFlow.from_client_secrets_file is easier given existing code structure,
-                     # but we need to handle the Env Var case which returns a dict (client_config).
-                     pass 
-
-                if client_config:
-                     # Flow from dict
-                     try:
-                        flow = InstalledAppFlow.from_client_config(client_config, SCOPES)
-                        # We cannot run local server on a headless server without port forwarding, 
-                        # so this path is mostly for local setup if we injected env vars but no token yet.
-                        # On a real server, we expect the TOKEN to be present if we are running.
-                        # But for completeness:
-                        self.creds = flow.run_local_server(port=0)
-                     except Exception as e:
-                         logger.error(f"Failed flow from client config: {e}")
-
-                elif os.path.exists(creds_path):
-                    try:
-                        flow = InstalledAppFlow.from_client_secrets_file(
-                            creds_path, SCOPES)
-                        # Run local server for auth
-                        self.creds = flow.run_local_server(port=0)
-                        # Save the credentials for the next run
-                        with open(token_path, 'w') as token:
-                            token.write(self.creds.to_json())
-                        logger.info("Generated new token.json locally.")
-                    except Exception as e:
-                        logger.error(f"Failed to auth flow from file: {e}")
-                        return False
-                else:
-                    logger.warning(f"No credentials found (Env or File). Calendar disabled.")
-                    return False
-
-        try:
-            self.service = build('calendar', 'v3', credentials=self.creds)
-            logger.info("Calendar service initialized successfully.")
-            return True
-        except Exception as e:
-            logger.error(f"Failed to build calendar service: {e}")
-            return False
+                res = await self.service.get(f"/calendars/{quote(cal['id'], safe='')}/events", **params)
+            except GoogleAPIError as e:
+                if e.status == 404:
+                    # Unsubscribed since the list was cached
+                    _calendar_list["fetched_at"] = 0.0
+                return []
+            except Exception:
+                return []
+        events = res.get('items', [])
+        # Tag events with calendar color/name if needed (optional)
+        for e in events:
+            e['_cal_name'] = cal.get('summary')
+        return events
 
-    def get_upcoming_events(self, days_ahead=7):
+    async def get_upcoming_events(self, days_ahead=7):
         """
         Returns a pre-formatted string matching Google Calendar's Agenda View.
-        Events are exploded: if an event spans 3 days, it appears in all 3 day buckets.
+        Events are exploded: if an event spans 3 days (all-day, or timed across
+        midnight), it appears in all 3 day buckets.
         """
         if not self.service:
-            if not self.authenticate():
+            if not await self.authenticate():
                 return "No calendar access"
 
         try:
@@ -135,123 +74,42 @@ class CalendarService:
             time_max = end_time = end_range.replace(hour=23, minute=59).isoformat()
             
             # 1. Fetch from ALL calendars
-            cal_list = self.service.calendarList().list().execute()
-            calendars = cal_list.get('items', [])
-            
-            raw_events = []
-            for cal in calendars:
-                try:
-                    res = self.service.events().list(
-                        calendarId=cal['id'], timeMin=time_min, timeMax=time_max,
+            if calendar_mirror.is_fresh():
+                # Local mirror (kept current by incremental sync), no round trip
+                events = calendar_mirror.events_between(start_range, end_range.replace(hour=23, minute=59))
+            else:
+                # Concurrent, bounded fan-out: latency is the slowest calendar, not the sum
+                calendars = await self.get_calendars()
+                semaphore = asyncio.Semaphore(settings.CALENDAR_FANOUT_CONCURRENCY)
+                per_calendar = await asyncio.gather(*(
+                    self._list_calendar_events(
+                        cal, semaphore, timeMin=time_min, timeMax=time_max,
                         singleEvents=True, orderBy='startTime'
-                    ).execute()
-                    # Tag events with calendar color/name if needed (optional)
-                    for e in res.get('items', []):
-                        e['_cal_name'] = cal.get('summary')
-                        raw_events.append(e)
-                except: continue
-
-            # 2. Bucket Logic (The "Explosion")
-            # buckets = { datetime.date: [ (time_sort_key, string_representation) ] }
-            daily_buckets = {}
-            # Init buckets for the requested range
-            curr = start_range.date()
-            end_date_limit = end_range.date()
-            while curr <= end_date_limit:
-                daily_buckets[curr] = []
-                curr += timedelta(days=1)
-
-            for event in raw_events:
-                summary = event.get('summary', 'Sin título')
-                start = event['start']
-                end = event['end']
-                
-                # Normalize to Date objects
-                if 'date' in start:
-                    # All Day
-                    s_dt = datetime.strptime(start['date'], "%Y-%m-%d").date()
-                    # Google end date is exclusive, so actual end is -1 day
-                    e_dt = datetime.strptime(end['date'], "%Y-%m-%d").date() - timedelta(days=1)
-                    is_all_day = True
-                else:
-                    # Timed
-                    s_dt_full = datetime.fromisoformat(start['dateTime'])
-                    e_dt_full = datetime.fromisoformat(end['dateTime'])
-                    if s_dt_full.tzinfo is None: s_dt_full = s_dt_full.replace(tzinfo=tz)
-                    else: s_dt_full = s_dt_full.astimezone(tz)
-                    
-                    s_dt = s_dt_full.date()
-                    # For logic simplicity, treat timed events as single day if they don't span midnight drastically
-                    # But if they do, we should explode. For now let's stick to start date for timed.
-                    e_dt = s_dt 
-                    is_all_day = False
-                    start_time_str = s_dt_full.strftime("%H:%M")
-                    end_time_str = e_dt_full.strftime("%H:%M")
-
-                # Clamp to query range
-                loop_start = max(s_dt, start_range.date())
-                loop_end = min(e_dt, end_date_limit)
-                
-                # Iterate every day this event touches
-                loop_curr = loop_start
-                while loop_curr <= loop_end:
-                    if loop_curr in daily_buckets:
-                        if is_all_day:
-                            # 🔵 Todo el día | Título
-                            line = f"🔵 Todo el día | {summary}"
-                            sort_k = "00:00"
-                        else:
-                            # 🔵 07:00 - 15:00 | Título
-                            line = f"🔵 {start_time_str} - {end_time_str} | {summary}"
-                            sort_k = start_time_str
-                        
-                        daily_buckets[loop_curr].append((sort_k, line))
-                    loop_curr += timedelta(days=1)
-
-            # 3. Format Output
-            output_lines = []
-            
-            # Helper for Spanish months/days
-            months_es = {1:"ENE", 2:"FEB", 3:"MAR", 4:"ABR", 5:"MAY", 6:"JUN", 7:"JUL", 8:"AGO", 9:"SEP", 10:"OCT", 11:"NOV", 12:"DIC"}
-            days_es = {0:"LUN", 1:"MAR", 2:"MIÉ", 3:"JUE", 4:"VIE", 5:"SÁB", 6:"DOM"}
-
-            sorted_dates = sorted(daily_buckets.keys())
-            for d in sorted_dates:
-                events_on_day = daily_buckets[d]
-                if not events_on_day:
-                    continue # Skip empty days or show "No events"? User image skips empty hours but shows days.
-                
-                # Header: 20 ENE, MAR
-                day_str = days_es[d.weekday()]
-                month_str = months_es[d.month]
-                header = f"🗓 **{d.day} {month_str}, {day_str}**"
-                output_lines.append(header)
-                
-                # Sort by time
-                events_on_day.sort(key=lambda x: x[0])
-                
-                for _, line in events_on_day:
-                    output_lines.append(line)
-                
-                output_lines.append("") # Spacer
+                    )
+                    for cal in calendars
+                ))
+                events = []
+                for raw in (e for cal_events in per_calendar for e in cal_events):
+                    try:
+                        events.append(AgendaEvent.from_api(raw, raw.get('_cal_name')))
+                    except (KeyError, ValueError):
+                        continue
 
-            if not output_lines:
-                return "No hay eventos próximos."
-                
-            return "\n".join(output_lines)
+            # 2. Day buckets + Spanish formatting (days whose events did not change come from cache)
+            return agenda_renderer.render(events, start_range.date(), end_range.date())
 
         except Exception as e:
             logger.error(f"Calendar fetch error: {e}")
             return f"Error leyendo calendario: {e}"
 
-    def add_event(self, summary, start_time, end_time=None):
+    async def add_event(self, summary, start_time, end_time=None):
         """
         Creates a new event.
         start_time: datetime object or ISO string
         end_time: datetime object or ISO string (optional, defaults to +1 hour)
         """
         if not self.service:
-            if not self.authenticate():
+            if not await self.authenticate():
                 return False
 
         try:
@@ -287,30 +145,38 @@ class CalendarService:
                 },
             }
 
-            event = self.service.events().insert(calendarId='primary', body=event).execute()
+            event = await self.service.request("POST", "/calendars/primary/events", body=event)
             logger.info(f"Event created: {event.get('htmlLink')}")
+            await calendar_mirror.apply_local(event)
             return True
 
         except Exception as e:
             logger.error(f"Failed to create event: {e}")
             return False
 
-    def find_next_event(self, query):
+    async def find_next_event(self, query):
         """Finds the next upcoming event matching query string."""
         if not self.service:
-            if not self.authenticate():
+            if not await self.authenticate():
                 return None
         
         try:
             now = datetime.utcnow()
             time_min = now.isoformat() + 'Z'
             
-            # Search next 30 days
-            events_result = self.service.events().list(
-                calendarId='primary', 
+            primary_id = calendar_mirror.primary_id()
+            if calendar_mirror.is_fresh() and primary_id:
+                # Fuzzy index over the whole mirrored horizon ("cumple" -> "Cumpleaños"),
+                # best match first, then soonest
+                now_tz = datetime.now(ZoneInfo("America/Argentina/Buenos_Aires"))
+                matches = calendar_mirror.search(query, now_tz, primary_id)
+                return matches[0] if matches else None
+
+            events_result = await self.service.get(
+                "/calendars/primary/events",
                 timeMin=time_min,
                 maxResults=50, singleEvents=True,
-                orderBy='startTime').execute()
+                orderBy='startTime')
             events = events_result.get('items', [])
             
             query = query.lower()
@@ -323,14 +189,74 @@ class CalendarService:
             logger.error(f"Search error: {e}")
             return None
 
-    def delete_event(self, event_id):
+    async def delete_event(self, event_id):
         if not self.service:
-            if not self.authenticate():
+            if not await self.authenticate():
                 return False
         try:
-            self.service.events().delete(calendarId='primary', eventId=event_id).execute()
+            await self.service.request("DELETE", f"/calendars/primary/events/{quote(event_id, safe='')}")
+            await calendar_mirror.apply_local({"id": event_id}, deleted=True)
             logger.info(f"Event {event_id} deleted.")
             return True
         except Exception as e:
             logger.error(f"Delete error: {e}")
             return False
+
+    async def query_freebusy(self, time_min, time_max, calendar_ids=None):
+        """
+        Busy intervals per calendar: {calendar_id: [{"start", "end"}, ...]}.
+        Returns None on error.
+        """
+        if not self.service:
+            if not await self.authenticate():
+                return None
+        try:
+            body = {
+                "timeMin": time_min.isoformat() if isinstance(time_min, datetime) else time_min,
+                "timeMax": time_max.isoformat() if isinstance(time_max, datetime) else time_max,
+                "items": [{"id": cal_id} for cal_id in (calendar_ids or ["primary"])],
+            }
+            result = await self.service.request("POST", "/freeBusy", body=body)
+            return {cal_id: cal.get('busy', []) for cal_id, cal in result.get('calendars', {}).items()}
+        except Exception as e:
+            logger.error(f"Freebusy error: {e}")
+            return None
+
+    async def find_free_slots(self, duration_minutes=60, days_ahead=7, max_slots=5):
+        """
+        Free windows of at least duration_minutes inside working hours, soonest first:
+        [(start, end)] as aware datetimes. Busy time comes from the local mirror when it
+        is fresh, otherwise from one freeBusy query across every calendar.
+        Returns None on error.
+        """
+        tz = ZoneInfo("America/Argentina/Buenos_Aires")
+        now = datetime.now(tz)
+        horizon = (now + timedelta(days=days_ahead)).replace(hour=23, minute=59, second=59, microsecond=0)
+
+        # 1. Busy intervals ("Disponible" events do not block)
+        if calendar_mirror.is_fresh():
+            busy = [(e.start, e.end) for e in calendar_mirror.events_between(now, horizon) if e.busy]
+        else:
+            if not self.service:
+                if not await self.authenticate():
+                    return None
+            try:
+                calendars = await self.get_calendars()
+            except Exception as e:
+                logger.error(f"Free slots error: {e}")
+                return None
+            # freeBusy accepts up to 50 calendars per query
+            result = await self.query_freebusy(now, horizon, [cal['id'] for cal in calendars][:50] or None)
+            if result is None:
+                return None
+            busy = [
+                (datetime.fromisoformat(b['start'].replace('Z', '+00:00')).astimezone(tz),
+                 datetime.fromisoformat(b['end'].replace('Z', '+00:00')).astimezone(tz))
+                for intervals in result.values() for b in intervals
+            ]
+
+        # 2. Merge, then take the gaps of each working day
+        return free_slots(
+            merge_intervals(busy), now, horizon, timedelta(minutes=duration_minutes),
+            settings.WORK_DAY_START_HOUR, settings.WORK_DAY_END_HOUR, settings.WORK_DAYS, max_slots
+        )
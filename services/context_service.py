@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+from config import settings
+from services.garmin import garmin_metrics
+from services.calendar_service import CalendarService
+from services.tasks_service import TasksService
+
+logger = logging.getLogger(__name__)
+
+
+async def _fetch_garmin():
+    return await garmin_metrics.get() # Cached, refreshed in the background
+
+async def _fetch_calendar():
+    return await CalendarService().get_upcoming_events(3) # 3 days keeps the prompt small
+
+async def _fetch_tasks():
+    return await TasksService().get_todays_tasks()
+
+
+class ContextService:
+    """
+    Gathers the context blocks (Biometría, Agenda, Tareas) for the Assistant.
+    Every source runs with its own timeout, so sources never wait on each other.
+    All sources are native async; Garmin answers from its warm cache.
+    """
+
+    SOURCES = {
+        "garmin": _fetch_garmin,
+        "calendar": _fetch_calendar,
+        "tasks": _fetch_tasks,
+    }
+
+    def __init__(self):
+        self.timeouts = {
+            "garmin": settings.CONTEXT_TIMEOUT_GARMIN,
+            "calendar": settings.CONTEXT_TIMEOUT_CALENDAR,
+            "tasks": settings.CONTEXT_TIMEOUT_TASKS,
+        }
+
+    async def _run_source(self, name: str):
+        """Runs one source without blocking the loop. Returns None on error or timeout."""
+        fetch = self.SOURCES[name]
+        timeout = self.timeouts[name]
+        started = time.monotonic()
+        call = fetch() if asyncio.iscoroutinefunction(fetch) else asyncio.to_thread(fetch)
+        try:
+            result = await asyncio.wait_for(call, timeout=timeout)
+            logger.info(f"Context '{name}' ready in {time.monotonic() - started:.2f}s")
+            return result
+        except asyncio.TimeoutError:
+            # Async sources are cancelled; a worker thread keeps running, but nobody waits for it
+            logger.warning(f"Context '{name}' timed out after {timeout}s")
+        except Exception as e:
+            logger.error(f"Context '{name}' failed: {e}")
+        return None
+
+    def start(self, names=None) -> dict:
+        """
+        Kicks off the requested sources in the background and returns {name: Task}.
+        Used to prefetch speculatively while other work (e.g. routing) is in flight.
+        """
+        names = list(names or self.SOURCES)
+        return {name: asyncio.create_task(self._run_source(name)) for name in names}
+
+    async def collect(self, tasks: dict) -> dict:
+        """
+        Waits for tasks created by start().
+        Returns {name: result} only for the sources that finished in time.
+        """
+        results = await asyncio.gather(*tasks.values())
+        return {name: result for name, result in zip(tasks, results) if result is not None}
+
+    def cancel(self, tasks: dict):
+        """Drops a prefetch that the chosen route does not need."""
+        for task in tasks.values():
+            task.cancel()
+
+    async def gather(self, names=None) -> dict:
+        """Fetches the requested sources in parallel and waits for them."""
+        return await self.collect(self.start(names))
@@ -0,0 +1,241 @@
+import logging
+from datetime import date, datetime, timedelta
+import numpy as np
+from sqlalchemy import func, select
+from config import settings
+from database.db import async_session
+from database.models import BiometricDay, CheckIn, EnergyLog
+from services.agenda import DAYS_ES, TZ
+from services.biometric_store import biometric_store
+from services.calendar_mirror import calendar_mirror
+from services.text_utils import normalize_text
+
+logger = logging.getLogger(__name__)
+
+ROLLING_DAYS = 7
+MIN_CORRELATION = 0.3 # Weaker correlations are not worth a line in the prompt
+
+# Rotating shifts (7-15, 15-23, nights), told apart by the start hour of a 6-10 h event
+SHIFTS = ("Libre", "Mañana", "Tarde", "Noche")
+
+
+def _shift_of(start_hour: int) -> int:
+    if 5 <= start_hour <= 9:
+        return 1
+    if 13 <= start_hour <= 17:
+        return 2
+    if start_hour >= 21 or start_hour <= 1:
+        return 3
+    return 0
+
+
+# --- Vectorized helpers (one NaN-aware pass per series) ---
+
+def daily_mean(day_idx: np.ndarray, values: np.ndarray, n_days: int) -> np.ndarray:
+    """Mean of the samples of each day; NaN for days without samples."""
+    mask = ~np.isnan(values) & (day_idx >= 0) & (day_idx < n_days)
+    sums = np.bincount(day_idx[mask], weights=values[mask], minlength=n_days)
+    counts = np.bincount(day_idx[mask], minlength=n_days)
+    return np.divide(sums, counts, out=np.full(n_days, np.nan), where=counts > 0)
+
+
+def daily_max(day_idx: np.ndarray, values: np.ndarray, n_days: int) -> np.ndarray:
+    out = np.full(n_days, -np.inf)
+    mask = (day_idx >= 0) & (day_idx < n_days)
+    np.maximum.at(out, day_idx[mask], values[mask])
+    out[np.isinf(out)] = np.nan
+    return out
+
+
+def rolling_mean(x: np.ndarray, window: int = ROLLING_DAYS) -> np.ndarray:
+    """Trailing mean over `window` days, skipping NaN days."""
+    valid = ~np.isnan(x)
+    kernel = np.ones(window)
+    sums = np.convolve(np.where(valid, x, 0.0), kernel)[:len(x)]
+    counts = np.convolve(valid.astype(float), kernel)[:len(x)]
+    return np.divide(sums, counts, out=np.full(len(x), np.nan), where=counts > 0)
+
+
+def group_means(groups: np.ndarray, values: np.ndarray, n_groups: int):
+    """(mean, count) of values per group id; NaN values are skipped."""
+    mask = ~np.isnan(values) & (groups >= 0)
+    sums = np.bincount(groups[mask], weights=values[mask], minlength=n_groups)
+    counts = np.bincount(groups[mask], minlength=n_groups)
+    return np.divide(sums, counts, out=np.full(n_groups, np.nan), where=counts > 0), counts
+
+
+def correlation(x: np.ndarray, y: np.ndarray, min_samples: int):
+    """(Pearson r, n) over days where both are known, or None with too few samples."""
+    mask = ~np.isnan(x) & ~np.isnan(y)
+    n = int(mask.sum())
+    if n < min_samples or x[mask].std() == 0 or y[mask].std() == 0:
+        return None
+    return float(np.corrcoef(x[mask], y[mask])[0, 1]), n
+
+
+class EnergyAnalytics:
+    """
+    Trends and correlations over check-ins (mood, sleep, body battery, emotion
+    words), Garmin history (BiometricDay series, EnergyLog sleep scores) and
+    shifts found in the calendar mirror. Everything is turned into per-day
+    NumPy arrays first, then computed in vectorized passes.
+    Results are cached per user until a new check-in, sleep score or Garmin day arrives.
+    """
+
+    def __init__(self):
+        self.cache = {} # user_id -> (data version, insights text)
+
+    async def _version(self, user_id: int) -> tuple:
+        async with async_session() as session:
+            row = (await session.execute(select(
+                select(func.max(CheckIn.id)).where(CheckIn.user_id == user_id).scalar_subquery(),
+                select(func.max(EnergyLog.id)).where(EnergyLog.user_id == user_id).scalar_subquery(),
+                select(func.max(BiometricDay.updated_at)).where(BiometricDay.user_id == user_id).scalar_subquery(),
+            ))).one()
+        # Windows are relative to today, so a new day also invalidates
+        return (date.today(), *row)
+
+    async def _load(self, user_id: int, start: date, n_days: int) -> dict:
+        """Per-day arrays (length n_days, NaN = no data) for the window starting at start."""
+        offset = datetime.now(TZ).utcoffset()
+        since = datetime(start.year, start.month, start.day) - offset # Local midnight as naive UTC
+
+        async with async_session() as session:
+            checkins = (await session.execute(
+                select(CheckIn.timestamp, CheckIn.mood_score, CheckIn.sleep_score, CheckIn.body_battery, CheckIn.emotion_word)
+                .where(CheckIn.user_id == user_id, CheckIn.timestamp >= since)
+            )).all()
+            sleep_logs = (await session.execute(
+                select(EnergyLog.timestamp, EnergyLog.level)
+                .where(EnergyLog.user_id == user_id, EnergyLog.source == "garmin_sleep", EnergyLog.timestamp >= since)
+            )).all()
+
+        def day_index(timestamps) -> np.ndarray:
+            local = np.array(timestamps, dtype="datetime64[s]") + np.timedelta64(int(offset.total_seconds()), "s")
+            return (local.astype("datetime64[D]") - np.datetime64(start)).astype(np.int64)
+
+        def column(rows, i, zero_is_missing=False) -> np.ndarray:
+            values = np.array([np.nan if r[i] is None else r[i] for r in rows], dtype=float)
+            if zero_is_missing:
+                values[values == 0] = np.nan
+            return values
+
+        days = {}
+        if checkins:
+            ci_day = day_index([r[0] for r in checkins])
+            days["mood"] = daily_mean(ci_day, column(checkins, 1), n_days)
+            checkin_sleep = daily_mean(ci_day, column(checkins, 2, zero_is_missing=True), n_days)
+            days["bb_checkin"] = daily_mean(ci_day, column(checkins, 3), n_days)
+            days["words"] = (np.array([normalize_text(r[4] or "") for r in checkins]), column(checkins, 1))
+        else:
+            days["mood"] = checkin_sleep = days["bb_checkin"] = np.full(n_days, np.nan)
+            days["words"] = None
+
+        # Sleep: Garmin score (stamped at wake-up) when there is one, the check-in otherwise
+        garmin_sleep = daily_mean(day_index([r[0] for r in sleep_logs]), column(sleep_logs, 1), n_days) \
+            if sleep_logs else np.full(n_days, np.nan)
+        days["sleep"] = np.where(np.isnan(garmin_sleep), checkin_sleep, garmin_sleep)
+
+        # Intraday Garmin series: daily body battery peak and mean stress
+        for series, reduce, key in (("body_battery", daily_max, "bb_peak"), ("stress", daily_mean, "stress")):
+            times, levels = await biometric_store.load(user_id, start, start + timedelta(days=n_days - 1), series)
+            days[key] = reduce(day_index(times), levels.astype(float), n_days) if len(times) else np.full(n_days, np.nan)
+
+        # Shift per day, from the calendar mirror
+        shifts = np.full(n_days, -1, dtype=np.int64) # -1 = unknown (outside the mirror)
+        window_start = datetime(start.year, start.month, start.day, tzinfo=TZ)
+        events = [
+            e for e in calendar_mirror.events_between(window_start, window_start + timedelta(days=n_days))
+            if not e.all_day and timedelta(hours=6) <= e.end - e.start <= timedelta(hours=10)
+        ]
+        if events:
+            idx = np.array([(e.start.date() - start).days for e in events])
+            kinds = np.array([_shift_of(e.start.hour) for e in events])
+            first_day = max(0, int(idx.min()))
+            shifts[first_day:] = 0
+            keep = (kinds > 0) & (idx >= 0)
+            shifts[idx[keep]] = kinds[keep]
+        days["shift"] = shifts
+        return days
+
+    def _insights(self, days: dict, start: date, n_days: int) -> list:
+        min_samples = settings.ANALYTICS_MIN_SAMPLES
+        lines = []
+
+        # 1. Trends: last 7 days vs the 7 before
+        for key, label, fmt in (("mood", "Ánimo", "{:.1f}/5"), ("sleep", "Sueño", "{:.0f}"),
+                                ("bb_peak", "Body Battery pico", "{:.0f}"), ("stress", "Estrés medio", "{:.0f}")):
+            rolling = rolling_mean(days[key])
+            now, before = rolling[-1], rolling[-1 - ROLLING_DAYS] if n_days > ROLLING_DAYS else np.nan
+            if np.isnan(now):
+                continue
+            line = f"{label} (7d): {fmt.format(now)}"
+            if not np.isnan(before):
+                line += f" (antes {fmt.format(before)})"
+            lines.append(line)
+
+        # 2. Day-of-week effect on mood
+        weekdays = (np.arange(n_days) + start.weekday()) % 7
+        means, counts = group_means(weekdays, days["mood"], 7)
+        means[counts < 2] = np.nan
+        if (counts >= 2).sum() >= 3 and (~np.isnan(days["mood"])).sum() >= min_samples:
+            low, high = int(np.nanargmin(means)), int(np.nanargmax(means))
+            if means[high] - means[low] >= 0.5:
+                lines.append(f"Ánimo más bajo los {DAYS_ES[low]} ({means[low]:.1f}) y más alto los {DAYS_ES[high]} ({means[high]:.1f})")
+
+        # 3. Shift pattern effect
+        mood_by_shift, mood_n = group_means(days["shift"], days["mood"], len(SHIFTS))
+        bb_by_shift, _ = group_means(days["shift"], np.where(np.isnan(days["bb_peak"]), days["bb_checkin"], days["bb_peak"]), len(SHIFTS))
+        parts = [
+            f"{SHIFTS[s]}: ánimo {mood_by_shift[s]:.1f}" + (f", BB {bb_by_shift[s]:.0f}" if not np.isnan(bb_by_shift[s]) else "")
+            for s in range(len(SHIFTS)) if mood_n[s] >= 2
+        ]
+        if len(parts) >= 2:
+            lines.append("Por turno: " + " | ".join(parts))
+
+        # 4. Correlations (sleep is stamped on the wake-up day: same index = the day after the night)
+        pairs = (
+            ("Sueño vs ánimo del día siguiente", days["sleep"], days["mood"]),
+            ("Estrés del día vs sueño de esa noche", days["stress"][:-1], days["sleep"][1:]),
+            ("Body Battery pico vs ánimo", days["bb_peak"], days["mood"]),
+        )
+        for label, x, y in pairs:
+            result = correlation(x, y, min_samples)
+            if result and abs(result[0]) >= MIN_CORRELATION:
+                lines.append(f"{label}: r={result[0]:+.2f} (n={result[1]})")
+
+        # 5. Most frequent emotion words, with the mood that came with them
+        if days["words"] is not None:
+            words, moods = days["words"]
+            valid = (words != "") & (words != "n a")
+            if valid.any():
+                vocab, inverse, counts = np.unique(words[valid], return_inverse=True, return_counts=True)
+                word_mood, _ = group_means(inverse, moods[valid], len(vocab))
+                top = np.argsort(-counts, kind="stable")[:3]
+                lines.append("Emociones frecuentes: " + ", ".join(
+                    f"{vocab[i]} x{counts[i]}" + (f" (ánimo {word_mood[i]:.1f})" if not np.isnan(word_mood[i]) else "")
+                    for i in top
+                ))
+        return lines
+
+    async def get_insights(self, user_id: int):
+        """Pre-computed insights for the consultant prompt (str), or None without enough data."""
+        try:
+            version = await self._version(user_id)
+            cached = self.cache.get(user_id)
+            if cached and cached[0] == version:
+                return cached[1]
+
+            n_days = settings.ANALYTICS_WINDOW_DAYS
+            start = datetime.now(TZ).date() - timedelta(days=n_days - 1)
+            days = await self._load(user_id, start, n_days)
+            lines = self._insights(days, start, n_days)
+            text = "; ".join(lines) if lines else None
+            self.cache[user_id] = (version, text)
+            return text
+        except Exception as e:
+            logger.error(f"Energy analytics error: {e}")
+            return None
+
+
+energy_analytics = EnergyAnalytics()
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+from config import settings
+from database.db import async_session
+from database.models import BiometricDay, EnergyLog
+from services.agenda import TZ
+from services.garmin import GarminService
+from services.biometric_store import biometric_store
+from services.scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+
+# Days fetched from Garmin (and committed) per step of a long backfill
+CHUNK_DAYS = 7
+
+
+def _utc(ms) -> datetime:
+    """Garmin epoch milliseconds (GMT) -> naive UTC, like every other timestamp in the DB."""
+    return datetime.utcfromtimestamp(ms / 1000)
+
+
+class EnergyIngestService:
+    """
+    Copies Garmin history into the local DB, so biometric questions are read locally:
+    - Intraday body battery and stress (3-minute samples) go to the compact
+      per-day arrays of BiometricDay (services/biometric_store.py).
+    - The nightly sleep score goes to EnergyLog, bulk-inserted in batched
+      transactions with ON CONFLICT DO NOTHING on (user, timestamp, source).
+    - The first run backfills ENERGY_BACKFILL_DAYS; after that every run pulls
+      from the last stored day (at least yesterday) to today. Overlaps never
+      duplicate points.
+    """
+
+    def __init__(self, user_id: int = None):
+        self._user_id = user_id
+        self._lock = asyncio.Lock()
+
+    @property
+    def user_id(self):
+        """The Garmin account is the bot owner's (first admin), resolved when a job runs."""
+        if self._user_id:
+            return self._user_id
+        return settings.ADMIN_IDS[0] if settings.ADMIN_IDS else None
+
+    # --- Garmin (blocking, runs in a worker thread) ---
+    def _fetch_range(self, user_id: int, start: date, end: date):
+        """Returns (EnergyLog rows, {day: {series: (epoch seconds, levels)}})."""
+        # Through GarminService: shared session, re-login on a revoked one, token saving
+        garmin = GarminService()
+        rows, days = [], {}
+
+        def series(day: date, name: str, points: list):
+            # Negative levels are Garmin's "not measured" markers (off wrist, activity)
+            points = [p for p in points if p[0] is not None and p[1] is not None and p[1] >= 0]
+            if points:
+                values = np.array([p[:2] for p in points], dtype=np.int64)
+                days.setdefault(day, {})[name] = (values[:, 0] // 1000, values[:, 1])
+
+        # 1. Body battery: one call for the whole range
+        for item in garmin.get_body_battery(start, end):
+            if item.get("date"):
+                series(date.fromisoformat(item["date"]), "body_battery", item.get("bodyBatteryValuesArray") or [])
+
+        day = start
+        while day <= end:
+            # 2. Stress (intraday)
+            stress = garmin.get_stress_data(day)
+            series(day, "stress", stress.get("stressValuesArray") or [])
+
+            # 3. Sleep score, stamped at wake-up
+            sleep = garmin.get_sleep_data(day).get("dailySleepDTO") or {}
+            score = ((sleep.get("sleepScores") or {}).get("overall") or {}).get("value")
+            if sleep.get("sleepEndTimestampGMT") and score is not None:
+                rows.append({
+                    "user_id": user_id, "timestamp": _utc(sleep["sleepEndTimestampGMT"]),
+                    "level": int(score), "source": "garmin_sleep", "context": "Woke up",
+                })
+            day += timedelta(days=1)
+        return rows, days
+
+    # --- Storage ---
+    async def _insert(self, rows: list) -> int:
+        """Inserts rows in ENERGY_INGEST_BATCH_SIZE transactions. Returns how many were new."""
+        inserted = 0
+        size = settings.ENERGY_INGEST_BATCH_SIZE
+        stmt = insert(EnergyLog).on_conflict_do_nothing(index_elements=["user_id", "timestamp", "source"])
+        for i in range(0, len(rows), size):
+            async with async_session() as session:
+                # Core executemany on the connection (the ORM bulk path does not report rowcount)
+                conn = await session.connection()
+                result = await conn.execute(stmt, rows[i:i + size])
+                await session.commit()
+            inserted += max(result.rowcount, 0)
+        return inserted
+
+    async def _last_ingested(self, user_id: int):
+        """Last day with stored intraday series, or None."""
+        async with async_session() as session:
+            result = await session.execute(
+                select(func.max(BiometricDay.day)).where(BiometricDay.user_id == user_id)
+            )
+            return result.scalar()
+
+    # --- Jobs ---
+    async def ingest_range(self, start: date, end: date) -> int:
+        """Pulls [start, end] from Garmin in CHUNK_DAYS steps. Returns new EnergyLog rows."""
+        user_id = self.user_id
+        if user_id is None:
+            logger.warning("Energy ingest skipped: no ADMIN_IDS configured")
+            return 0
+        inserted = 0
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(end, chunk_start + timedelta(days=CHUNK_DAYS - 1))
+            rows, days = await asyncio.to_thread(self._fetch_range, user_id, chunk_start, chunk_end)
+            points = await biometric_store.put_days(user_id, days)
+            new = await self._insert(rows)
+            inserted += new
+            logger.info(f"Energy ingest {chunk_start}..{chunk_end}: {len(days)} days ({points} intraday points), "
+                        f"{new} new sleep scores")
+            chunk_start = chunk_end + timedelta(days=1)
+        return inserted
+
+    async def ingest_recent(self) -> int:
+        """Backfill on the first run, then incremental from the last stored day."""
+        user_id = self.user_id
+        if user_id is None:
+            logger.warning("Energy ingest skipped: no ADMIN_IDS configured")
+            return 0
+        async with self._lock:
+            # Garmin days are the wearer's (Argentina) days, whatever the server timezone
+            today = datetime.now(TZ).date()
+            last = await self._last_ingested(user_id)
+            if last is None:
+                start = today - timedelta(days=settings.ENERGY_BACKFILL_DAYS)
+            else:
+                # Yesterday's sleep and late points arrive after midnight
+                start = min(last, today - timedelta(days=1))
+            try:
+                return await self.ingest_range(start, today)
+            except Exception as e:
+                logger.error(f"Energy ingest failed: {e}")
+                return 0
+
+    def start(self):
+        """Schedules ingestion every ENERGY_INGEST_INTERVAL_HOURS (first run right away)."""
+        scheduler.add_job(
+            self.ingest_recent, "interval", hours=settings.ENERGY_INGEST_INTERVAL_HOURS,
+            next_run_time=datetime.now(), max_instances=1, coalesce=True
+        )
+
+
+energy_ingest = EnergyIngestService()
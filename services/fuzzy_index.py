@@ -0,0 +1,61 @@
+from services.text_utils import normalize_text, char_ngrams
+
+
+class FuzzyIndex:
+    """
+    In-memory trigram/token index over short texts (event summaries, task titles).
+    Accent, case and typo tolerant: "cumple" finds "Cumpleaños", "dentsta" finds "Dentista".
+    add/remove are incremental, so the mirrors keep it current as data changes.
+    """
+
+    def __init__(self):
+        self.postings = {} # trigram -> {key}
+        self.docs = {}     # key -> (tokens, trigrams)
+
+    def add(self, key, text: str):
+        self.remove(key)
+        norm = normalize_text(text)
+        grams = set(char_ngrams(norm))
+        self.docs[key] = (norm.split(), grams)
+        for g in grams:
+            self.postings.setdefault(g, set()).add(key)
+
+    def remove(self, key):
+        doc = self.docs.pop(key, None)
+        if doc is None:
+            return
+        for g in doc[1]:
+            keys = self.postings.get(g)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[g]
+
+    def search(self, query: str, min_score: float = 0.45, limit: int = None) -> list:
+        """
+        Ranked [(score, key)], best first.
+        score = 0.7 * share of the query trigrams found + 0.3 * share of query words
+        that start a word of the text.
+        """
+        norm = normalize_text(query)
+        q_grams = set(char_ngrams(norm))
+        if not q_grams:
+            return []
+        hits = {}
+        for g in q_grams:
+            for key in self.postings.get(g, ()):
+                hits[key] = hits.get(key, 0) + 1
+
+        q_tokens = norm.split()
+        ranked = []
+        for key, count in hits.items():
+            containment = 0.7 * count / len(q_grams)
+            if containment + 0.3 < min_score:
+                continue # Cannot reach min_score even with every word matching
+            tokens = self.docs[key][0]
+            prefixed = sum(1 for q in q_tokens if any(t.startswith(q) for t in tokens))
+            score = containment + 0.3 * prefixed / len(q_tokens)
+            if score >= min_score:
+                ranked.append((score, key))
+        ranked.sort(key=lambda x: x[0], reverse=True)
+        return ranked[:limit] if limit else ranked
@@ -1,32 +1,129 @@
-from garminconnect import Garmin
+from garminconnect import Garmin, GarminConnectAuthenticationError
 from config import settings
-from datetime import date
+from services.scheduler import scheduler
+from services.agenda import TZ
+from datetime import date, datetime
+import asyncio
 import logging
+import os.path
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# One logged-in client per process, shared by every GarminService()
+_session = {"client": None, "tokens": None}
+_session_lock = threading.Lock()
+
+# Counters
+session_stats = {"logins": 0, "resumes": 0, "login_failures": 0}
+
+
+def _token_store(client):
+    """Object holding the OAuth tokens: garth.Client (garminconnect < 0.3) or the native client."""
+    return getattr(client, "garth", None) or client.client
+
+
 class GarminService:
+    """
+    Garmin Connect access. The SSO login (slow, aggressively rate-limited) runs
+    once: its tokens are saved in GARMIN_TOKEN_DIR and resumed across instances
+    and restarts. Expired access tokens are refreshed by the client itself and
+    saved again, so a call normally costs a single stats request.
+    """
+
     def __init__(self):
         self.email = settings.GARMIN_EMAIL
         self.password = settings.GARMIN_PASSWORD
-        self.client = None
+        self.token_dir = os.path.join(BASE_DIR, settings.GARMIN_TOKEN_DIR)
+        self.client = _session["client"]
+
+    def _resume(self):
+        """Client from the saved tokens, or None."""
+        if not os.path.isdir(self.token_dir):
+            return None
+        try:
+            # No password: a rejected token store cannot fall back to a full login here
+            client = Garmin()
+            client.login(self.token_dir)
+            return client
+        except Exception as e:
+            logger.warning(f"Garmin saved session rejected, logging in again: {e}")
+            return None
+
+    def _save_tokens(self, client):
+        """Writes the tokens when they changed (first login or refresh)."""
+        try:
+            store = _token_store(client)
+            tokens = store.dumps()
+            if tokens != _session["tokens"]:
+                store.dump(self.token_dir)
+                _session["tokens"] = tokens
+        except Exception as e:
+            logger.error(f"Failed to save Garmin tokens: {e}")
 
     def connect(self):
-        if not self.client:
-            try:
-                self.client = Garmin(self.email, self.password)
-                self.client.login()
-                logger.info("Garmin connected successfully.")
-            except Exception as e:
-                logger.error(f"Failed to connect to Garmin: {e}")
-                raise e
-
-    def get_todays_metrics(self):
+        if self.client:
+            return
+        with _session_lock:
+            if _session["client"] is None:
+                client = self._resume()
+                if client:
+                    session_stats["resumes"] += 1
+                    logger.info("Garmin session resumed from saved tokens.")
+                else:
+                    try:
+                        client = Garmin(self.email, self.password)
+                        client.login()
+                        session_stats["logins"] += 1
+                        logger.info("Garmin connected successfully.")
+                    except Exception as e:
+                        session_stats["login_failures"] += 1
+                        logger.error(f"Failed to connect to Garmin: {e}")
+                        raise e
+                self._save_tokens(client)
+                _session["client"] = client
+            self.client = _session["client"]
+
+    def _drop_session(self):
+        """Forgets a revoked session so the next call logs in again."""
+        with _session_lock:
+            if _session["client"] is self.client:
+                _session["client"] = None
+        self.client = None
+
+    def _call(self, method: str, *args):
+        """
+        One Garmin API call on the shared session. A rejected session is dropped
+        (the next call logs in again); refreshed tokens are saved.
+        """
+        self.connect()
         try:
-            self.connect()
-            today = date.today().isoformat()
-            stats = self.client.get_stats(today)
-            
+            result = getattr(self.client, method)(*args)
+        except GarminConnectAuthenticationError:
+            self._drop_session()
+            raise
+        self._save_tokens(self.client)
+        return result
+
+    def get_body_battery(self, start: date, end: date) -> list:
+        """Daily body battery reports (with intraday values) for [start, end]."""
+        return self._call("get_body_battery", start.isoformat(), end.isoformat()) or []
+
+    def get_stress_data(self, day: date) -> dict:
+        return self._call("get_stress_data", day.isoformat()) or {}
+
+    def get_sleep_data(self, day: date) -> dict:
+        return self._call("get_sleep_data", day.isoformat()) or {}
+
+    def get_todays_metrics(self, day: date = None):
+        try:
+            # The wearer's day (Argentina), not the server's
+            day = day or datetime.now(TZ).date()
+            stats = self._call("get_stats", day.isoformat())
+
             # Extract relevant fields based on our analysis
             return {
                 "body_battery": stats.get("bodyBatteryMostRecentValue"),
@@ -37,3 +134,72 @@ class GarminService:
         except Exception as e:
             logger.error(f"Error fetching Garmin stats: {e}")
             return None
+
+
+class GarminMetricsCache:
+    """
+    Today's metrics kept warm in memory. An apscheduler job refreshes them every
+    GARMIN_REFRESH_INTERVAL_SECONDS, so consultant messages and check-ins get the
+    last good value immediately (with its age) instead of waiting on Garmin.
+    Metrics read on another day are never served: the cache counts as cold again.
+    Concurrent refreshes collapse into one in-flight fetch.
+    """
+
+    def __init__(self):
+        self.metrics = None    # Last good get_todays_metrics() result
+        self.day = None        # Day those metrics belong to
+        self.fetched_at = None # Epoch of that result
+        self._inflight = None  # Running fetch, shared by every waiter
+
+    def age(self):
+        """Seconds since the last good fetch, or None when there is none for today."""
+        if self.fetched_at is None or self.day != datetime.now(TZ).date():
+            return None
+        return time.time() - self.fetched_at
+
+    def snapshot(self):
+        """Today's cached metrics plus when they were read ('fetched_at' HH:MM, 'age_minutes')."""
+        age = self.age()
+        if self.metrics is None or age is None:
+            return None
+        fetched = datetime.fromtimestamp(self.fetched_at, TZ)
+        return {**self.metrics, "fetched_at": fetched.strftime("%H:%M"), "age_minutes": int(age // 60)}
+
+    async def _fetch(self):
+        day = datetime.now(TZ).date()
+        metrics = await asyncio.to_thread(GarminService().get_todays_metrics, day)
+        if metrics is not None:
+            self.metrics = metrics
+            self.day = day
+            self.fetched_at = time.time()
+        return metrics
+
+    async def refresh(self):
+        """Fetches now, or joins the fetch already running (single-flight)."""
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._fetch())
+        # Shielded: a caller timing out does not cancel the shared fetch
+        return await asyncio.shield(self._inflight)
+
+    async def get(self, max_age: float = None):
+        """
+        Last good metrics right away. Waits for Garmin when nothing was cached today
+        (or the cache is older than max_age seconds); past GARMIN_METRICS_TTL_SECONDS
+        it otherwise starts a refresh in the background.
+        """
+        age = self.age()
+        if age is None or (max_age is not None and age > max_age):
+            await self.refresh()
+        elif age > settings.GARMIN_METRICS_TTL_SECONDS and (self._inflight is None or self._inflight.done()):
+            self._inflight = asyncio.create_task(self._fetch())
+        return self.snapshot()
+
+    def start(self):
+        """Schedules the background refresh (first run right away). Call once at startup."""
+        scheduler.add_job(
+            self.refresh, "interval", seconds=settings.GARMIN_REFRESH_INTERVAL_SECONDS,
+            next_run_time=datetime.now(), max_instances=1, coalesce=True
+        )
+
+
+garmin_metrics = GarminMetricsCache()
@@ -0,0 +1,269 @@
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from datetime import datetime, timedelta
+import aiohttp
+import asyncio
+import json
+import logging
+import os.path
+from urllib.parse import urlencode, urlparse
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class GoogleAPIError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class GoogleClient:
+    """
+    One Google API (credentials + REST base URL), shared by the whole process.
+    - Requests go through the pool's aiohttp session (keep-alive connections),
+      so Calendar/Tasks calls never block the event loop.
+    - Tokens are refreshed with an async call, ahead of expiry by
+      GoogleClientPool.refresh_loop(), or on demand after a 401.
+    """
+
+    def __init__(self, pool: "GoogleClientPool", name: str, base_url: str, batch_url: str, scopes: list, token_file: str, token_env_vars: list):
+        self.pool = pool
+        self.name = name
+        self.base_url = base_url
+        self.batch_url = batch_url
+        self.scopes = scopes
+        self.token_path = os.path.join(BASE_DIR, token_file)
+        self.token_env_vars = token_env_vars
+        self.creds = None
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._refresh_lock = asyncio.Lock()
+
+    # --- Credentials ---
+    def _load_credentials(self):
+        """Env var -> local file -> OAuth flow (local setup only). Blocking, runs once."""
+        creds_path = os.path.join(BASE_DIR, 'credentials.json')
+        logger.info(f"Authenticating {self.name}. Token path: {self.token_path}, Creds path: {creds_path}")
+
+        # 1. Try Environment Variables (Priority for Server)
+        env_token_json = next((os.environ[v] for v in self.token_env_vars if os.environ.get(v)), None)
+        env_creds_json = os.environ.get('GOOGLE_CREDENTIALS_JSON')
+
+        if env_token_json:
+            try:
+                creds = Credentials.from_authorized_user_info(json.loads(env_token_json), self.scopes)
+                logger.info(f"Loaded {self.name} credentials from env var.")
+                return creds
+            except Exception as e:
+                logger.error(f"Failed to load {self.name} token from env var: {e}")
+
+        # 2. Try Local File (Fallback for Local Dev)
+        if os.path.exists(self.token_path):
+            try:
+                creds = Credentials.from_authorized_user_file(self.token_path, self.scopes)
+                logger.info(f"Loaded {self.name} credentials from local file.")
+                return creds
+            except Exception as e:
+                logger.error(f"Failed to load {self.name} token from file: {e}")
+
+        # 3. No token: interactive flow (only works where a browser is available)
+        client_config = None
+        if env_creds_json:
+            try:
+                client_config = json.loads(env_creds_json)
+                logger.info("Loaded Client Config from GOOGLE_CREDENTIALS_JSON env var.")
+            except Exception as e:
+                logger.error(f"Failed to parse creds env var: {e}")
+
+        try:
+            if client_config:
+                flow = InstalledAppFlow.from_client_config(client_config, self.scopes)
+                return flow.run_local_server(port=0)
+            if os.path.exists(creds_path):
+                flow = InstalledAppFlow.from_client_secrets_file(creds_path, self.scopes)
+                creds = flow.run_local_server(port=0)
+                # Save the credentials for the next run
+                with open(self.token_path, 'w') as token:
+                    token.write(creds.to_json())
+                logger.info(f"Generated new {os.path.basename(self.token_path)} locally.")
+                return creds
+        except Exception as e:
+            logger.error(f"Failed {self.name} auth flow: {e}")
+            return None
+
+        logger.warning(f"No credentials found (Env or File). {self.name} disabled.")
+        return None
+
+    async def ensure_credentials(self) -> bool:
+        """Loads the credentials once (off the loop). False when the API is not configured."""
+        if not self._loaded:
+            async with self._load_lock:
+                if not self._loaded:
+                    self.creds = await asyncio.to_thread(self._load_credentials)
+                    self._loaded = True
+        return self.creds is not None
+
+    def _expires_within(self, seconds: float) -> bool:
+        # google-auth keeps expiry as naive UTC
+        expiry = self.creds.expiry
+        return not self.creds.token or (expiry is not None and expiry - datetime.utcnow() <= timedelta(seconds=seconds))
+
+    async def refresh_if_needed(self, margin_seconds: float = 0, force: bool = False) -> bool:
+        """Refreshes the shared token if it expires within margin_seconds. Returns True if refreshed."""
+        if not await self.ensure_credentials() or not self.creds.refresh_token:
+            return False
+        async with self._refresh_lock:
+            if not force and not self._expires_within(margin_seconds):
+                return False
+            session = await self.pool.session()
+            async with session.post(self.creds.token_uri, data={
+                "client_id": self.creds.client_id,
+                "client_secret": self.creds.client_secret,
+                "refresh_token": self.creds.refresh_token,
+                "grant_type": "refresh_token",
+            }) as resp:
+                payload = await resp.json(content_type=None)
+                if resp.status != 200:
+                    raise GoogleAPIError(resp.status, payload.get("error_description") or payload.get("error", "refresh failed"))
+            self.creds.token = payload["access_token"]
+            self.creds.expiry = datetime.utcnow() + timedelta(seconds=payload.get("expires_in", 3600))
+            logger.info(f"{self.name} token refreshed (expires {self.creds.expiry:%H:%M} UTC).")
+            return True
+
+    # --- Requests ---
+    async def request(self, method: str, path: str, params: dict = None, body: dict = None, _retry: bool = True):
+        """
+        Calls base_url + path and returns the decoded JSON ({} for empty bodies).
+        Raises GoogleAPIError on HTTP errors.
+        """
+        if not await self.ensure_credentials():
+            raise GoogleAPIError(401, f"No {self.name} credentials")
+        await self.refresh_if_needed()
+
+        if params:
+            # aiohttp only takes str/int query values
+            params = {k: (str(v).lower() if isinstance(v, bool) else v) for k, v in params.items() if v is not None}
+
+        session = await self.pool.session()
+        async with session.request(
+            method, self.base_url + path, params=params, json=body,
+            headers={"Authorization": f"Bearer {self.creds.token}"}
+        ) as resp:
+            if resp.status == 401 and _retry:
+                # Revoked/rotated token: refresh once and retry
+                await self.refresh_if_needed(force=True)
+                return await self.request(method, path, params=params, body=body, _retry=False)
+            text = await resp.text()
+            payload = json.loads(text) if text else {}
+            if resp.status >= 400:
+                error = payload.get("error") if isinstance(payload, dict) else None
+                message = error.get("message") if isinstance(error, dict) else text
+                raise GoogleAPIError(resp.status, message)
+            return payload
+
+    async def get(self, path: str, **params):
+        return await self.request("GET", path, params=params)
+
+    async def batch(self, calls: list) -> list:
+        """
+        Sends up to 100 calls [(method, path, params, body)] as one multipart/mixed
+        batch request. Returns [(status, payload)] in the same order.
+        """
+        if not await self.ensure_credentials():
+            raise GoogleAPIError(401, f"No {self.name} credentials")
+        await self.refresh_if_needed()
+
+        prefix = urlparse(self.base_url).path
+        with aiohttp.MultipartWriter("mixed") as writer:
+            for i, (method, path, params, body) in enumerate(calls):
+                query = f"?{urlencode(params)}" if params else ""
+                lines = [f"{method} {prefix}{path}{query} HTTP/1.1"]
+                if body is not None:
+                    lines += ["Content-Type: application/json; charset=UTF-8", "", json.dumps(body, ensure_ascii=False)]
+                else:
+                    lines += ["", ""]
+                writer.append("\r\n".join(lines), {"Content-Type": "application/http", "Content-ID": f"<item{i}>"})
+
+        session = await self.pool.session()
+        results = [(0, {})] * len(calls)
+        async with session.post(
+            self.batch_url, data=writer, headers={"Authorization": f"Bearer {self.creds.token}"}
+        ) as resp:
+            if resp.status >= 400:
+                raise GoogleAPIError(resp.status, await resp.text())
+            reader = aiohttp.MultipartReader.from_response(resp)
+            while (part := await reader.next()) is not None:
+                content_id = part.headers.get("Content-ID", "")
+                raw = (await part.read()).decode("utf-8")
+                # Each part is a raw HTTP response: status line, headers, blank line, body
+                head, _, payload = raw.replace("\r\n", "\n").partition("\n\n")
+                status = int(head.split(None, 2)[1])
+                index = int(content_id.strip("<>").rsplit("item", 1)[-1])
+                results[index] = (status, json.loads(payload) if payload.strip() else {})
+        return results
+
+
+class GoogleClientPool:
+    """
+    Process-wide registry: CalendarService/TasksService share these clients and
+    one aiohttp session (connection pool with keep-alive) instead of re-authenticating.
+    """
+
+    def __init__(self):
+        self._session = None
+        self.clients = {
+            "calendar": GoogleClient(
+                self, "Calendar", "https://www.googleapis.com/calendar/v3",
+                "https://www.googleapis.com/batch/calendar/v3",
+                ['https://www.googleapis.com/auth/calendar'],
+                "token.json", ["GOOGLE_TOKEN_JSON"]
+            ),
+            "tasks": GoogleClient(
+                self, "Tasks", "https://tasks.googleapis.com/tasks/v1",
+                "https://tasks.googleapis.com/batch/tasks/v1",
+                ['https://www.googleapis.com/auth/tasks'],
+                "token_tasks.json", ["GOOGLE_TOKEN_TASKS_JSON", "GOOGLE_TOKEN_JSON"]
+            ),
+        }
+
+    def get(self, name: str) -> GoogleClient:
+        return self.clients[name]
+
+    async def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=settings.GOOGLE_HTTP_POOL_SIZE,
+                    keepalive_timeout=settings.GOOGLE_HTTP_KEEPALIVE_SECONDS,
+                ),
+                timeout=aiohttp.ClientTimeout(total=settings.GOOGLE_HTTP_TIMEOUT_SECONDS),
+            )
+        return self._session
+
+    async def start(self):
+        """Loads every client's credentials once at startup and launches the background token refresh."""
+        for client in self.clients.values():
+            await client.ensure_credentials()
+        asyncio.create_task(self.refresh_loop())
+
+    async def refresh_loop(self):
+        """Background task: refreshes tokens before they expire, off the request path."""
+        margin = settings.GOOGLE_TOKEN_REFRESH_MARGIN_SECONDS
+        while True:
+            for client in self.clients.values():
+                try:
+                    await client.refresh_if_needed(margin)
+                except Exception as e:
+                    logger.error(f"{client.name} background token refresh failed: {e}")
+            await asyncio.sleep(settings.GOOGLE_TOKEN_CHECK_INTERVAL_SECONDS)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+google_clients = GoogleClientPool()
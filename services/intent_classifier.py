@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import time
+from pathlib import Path
+import numpy as np
+from services.text_utils import normalize_text, char_ngrams
+
+logger = logging.getLogger(__name__)
+
+ROUTES = ["casual", "management", "breakdown", "consultant"]
+
+# review.category (review_interactions.py) -> route that should have handled it
+CATEGORY_TO_ROUTE = {
+    "emotional": "consultant",
+    "energy": "consultant",
+    "family": "consultant",
+    "task_with_load": "breakdown",
+    "task_simple": "management",
+}
+
+
+def extract_features(text: str) -> list:
+    """Word unigrams + bigrams + char trigrams (robust to typos and conjugations)."""
+    norm = normalize_text(text)
+    words = norm.split()
+    feats = [f"w:{w}" for w in words]
+    feats += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    feats += [f"c:{g}" for g in char_ngrams(norm)]
+    return feats
+
+
+class IntentClassifier:
+    """
+    Local router: TF-IDF + multinomial logistic regression, pure NumPy.
+    Trained offline (train_intent_classifier.py) from interaction_logs/.
+    A prediction is a handful of row lookups, well under a millisecond.
+    """
+
+    def __init__(self):
+        self.vocab = {}     # feature -> column
+        self.idf = None     # (V,)
+        self.W = None       # (V, C)
+        self.b = None       # (C,)
+        self.classes = list(ROUTES)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.W is not None
+
+    # --- Vectorizing ---
+    def _vectorize(self, text: str):
+        """Sparse L2-normalized TF-IDF row: (column indices, weights)."""
+        counts = {}
+        for f in extract_features(text):
+            col = self.vocab.get(f)
+            if col is not None:
+                counts[col] = counts.get(col, 0) + 1
+        if not counts:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        idx = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        vals = (1.0 + np.log(tf)) * self.idf[idx]
+        return idx, vals / np.linalg.norm(vals)
+
+    def _matrix(self, texts: list) -> np.ndarray:
+        X = np.zeros((len(texts), len(self.vocab)))
+        for i, text in enumerate(texts):
+            idx, vals = self._vectorize(text)
+            X[i, idx] = vals
+        return X
+
+    # --- Training ---
+    def fit(self, texts: list, labels: list, epochs: int = 400, lr: float = 2.0, l2: float = 1e-3, min_df: int = 1):
+        """Full-batch gradient descent on the softmax loss, classes re-weighted for balance."""
+        doc_freq = {}
+        for text in texts:
+            for f in set(extract_features(text)):
+                doc_freq[f] = doc_freq.get(f, 0) + 1
+        feats = sorted(f for f, df in doc_freq.items() if df >= min_df)
+        self.vocab = {f: i for i, f in enumerate(feats)}
+        n = len(texts)
+        self.idf = np.log((1 + n) / (1 + np.array([doc_freq[f] for f in feats], dtype=np.float64))) + 1.0
+
+        X = self._matrix(texts)
+        y = np.array([self.classes.index(l) for l in labels])
+        Y = np.eye(len(self.classes))[y]
+        counts = np.bincount(y, minlength=len(self.classes)).astype(np.float64)
+        sample_w = (n / (len(self.classes) * np.maximum(counts, 1)))[y][:, None]
+
+        self.W = np.zeros((X.shape[1], len(self.classes)))
+        self.b = np.zeros(len(self.classes))
+        for _ in range(epochs):
+            P = self._softmax(X @ self.W + self.b)
+            G = (P - Y) * sample_w / n
+            self.W -= lr * (X.T @ G + l2 * self.W)
+            self.b -= lr * G.sum(axis=0)
+        return self
+
+    @staticmethod
+    def _softmax(Z: np.ndarray) -> np.ndarray:
+        Z = Z - Z.max(axis=-1, keepdims=True)
+        E = np.exp(Z)
+        return E / E.sum(axis=-1, keepdims=True)
+
+    # --- Inference ---
+    def predict_proba(self, text: str) -> np.ndarray:
+        idx, vals = self._vectorize(text)
+        return self._softmax(vals @ self.W[idx] + self.b)
+
+    def predict(self, text: str):
+        """Returns {"destination", "confidence", "source"} or None when untrained."""
+        if not self.is_trained:
+            return None
+        probs = self.predict_proba(text)
+        best = int(np.argmax(probs))
+        return {"destination": self.classes[best], "confidence": float(probs[best]), "source": "local"}
+
+    # --- Persistence ---
+    def save(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        features = [""] * len(self.vocab)
+        for f, i in self.vocab.items():
+            features[i] = f
+        np.savez_compressed(
+            path, features=np.array(features), idf=self.idf, W=self.W, b=self.b,
+            classes=np.array(self.classes)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        model = cls()
+        with np.load(path) as data:
+            model.vocab = {str(f): i for i, f in enumerate(data["features"])}
+            model.idf, model.W, model.b = data["idf"], data["W"], data["b"]
+            model.classes = [str(c) for c in data["classes"]]
+        return model
+
+    @classmethod
+    def load_or_empty(cls, path: str) -> "IntentClassifier":
+        """Missing or broken model file -> untrained classifier (everything goes to the LLM)."""
+        if os.path.exists(path):
+            try:
+                model = cls.load(path)
+                logger.info(f"Intent classifier loaded: {path} ({len(model.vocab)} features)")
+                return model
+            except Exception as e:
+                logger.error(f"Failed to load intent classifier: {e}")
+        else:
+            logger.info(f"No intent classifier at {path}. Routing with LLM only.")
+        return cls()
+
+
+# --- Training Data ---
+
+def load_labeled_messages(log_dirs: list) -> dict:
+    """
+    Reads interaction logs and returns {normalized_text: {"text", "gold", "router"}}.
+    'gold' comes from the human review (review.category), 'router' from the
+    route the LLM router chose at the time (context.route).
+    """
+    messages = {}
+    for log_dir in log_dirs:
+        for log_file in sorted(Path(log_dir).glob("interactions_*.jsonl")):
+            with open(log_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    interaction = json.loads(line)
+                    text = interaction.get("user_message") or ""
+                    key = normalize_text(text)
+                    if not key:
+                        continue
+                    entry = messages.setdefault(key, {"text": text, "gold": None, "router": None})
+
+                    category = (interaction.get("review") or {}).get("category")
+                    if category in CATEGORY_TO_ROUTE:
+                        entry["gold"] = CATEGORY_TO_ROUTE[category]
+
+                    context = interaction.get("context") or {}
+                    # Only decisions made by the LLM router are teacher labels
+                    if context.get("route") in ROUTES and context.get("route_source", "llm") == "llm":
+                        entry["router"] = context["route"]
+    return messages
+
+
+def evaluate(model: IntentClassifier, texts: list, labels: list, threshold: float) -> dict:
+    """Accuracy, coverage at threshold (= router calls avoided) and latency."""
+    if not texts:
+        return {"n": 0}
+    correct = covered = covered_correct = 0
+    started = time.perf_counter()
+    for text, label in zip(texts, labels):
+        pred = model.predict(text)
+        hit = pred is not None and pred["destination"] == label
+        correct += hit
+        if pred is not None and pred["confidence"] >= threshold:
+            covered += 1
+            covered_correct += hit
+    elapsed = time.perf_counter() - started
+    return {
+        "n": len(texts),
+        "accuracy": correct / len(texts),
+        "coverage": covered / len(texts),
+        "accuracy_when_confident": covered_correct / covered if covered else None,
+        "router_calls_avoided": covered,
+        "avg_latency_ms": elapsed / len(texts) * 1000,
+    }
@@ -4,16 +4,48 @@ from openai import AsyncOpenAI
 from config import settings
 from datetime import datetime
 from zoneinfo import ZoneInfo
+from services.intent_classifier import IntentClassifier
+from services.route_cache import route_cache
+from database.db import async_session
+from database.models import AssistantThread
+from contextlib import aclosing, asynccontextmanager
+import hashlib
+import time
 import os
 
 logger = logging.getLogger(__name__)
 
+
+class RunSuperseded(Exception):
+    """Raised by chat_stream() when a newer message took over: whatever was streamed must be dropped."""
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only inlined into a run when the rules file cannot be read (never synced to the Assistant)
+FALLBACK_RULES = "Eres JARVISZ, asistente de Ariel. Sé breve y empático."
+
+# A failed instructions sync is retried on a later run, at most this often
+SYNC_RETRY_SECONDS = 60
+
+# Run statuses after which the thread accepts new messages again
+TERMINAL_RUN_STATUSES = ("completed", "incomplete", "cancelled", "failed", "expired")
+
 class OpenAIService:
     def __init__(self):
         try:
             self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY.get_secret_value())
             self.assistant_id = settings.OPENAI_ASSISTANT_ID
-            self.threads = {} # In-memory: user_id -> thread_id
+            self.threads = {} # In-memory cache of assistant_threads: user_id -> thread_id
+            self._thread_locks = {} # user_id -> asyncio.Lock (avoid duplicate threads)
+            self._run_locks = {} # user_id -> asyncio.Lock (one run per thread at a time)
+            self._run_generation = {} # user_id -> number of the newest message
+            self.active_runs = {} # user_id -> run_info of the run holding the lock
+            self._rules_cache = None # (mtime, text, sha256) of system_prompt_specialist.md
+            self._synced_rules_hash = None # Hash stored in the Assistant's instructions
+            self._checked_rules_hash = None # Last file hash compared against the Assistant
+            self._sync_retry_at = 0 # Epoch before which a failed sync is not retried
+            self._sync_lock = asyncio.Lock()
+            self.intent_classifier = IntentClassifier.load_or_empty(settings.INTENT_MODEL_PATH)
             logger.info(f"OpenAI Assistant Service initialized. Agent ID: {self.assistant_id}")
         except Exception as e:
             logger.error(f"Failed to init OpenAI: {e}")
@@ -22,94 +54,418 @@ class OpenAIService:
     async def _get_or_create_thread(self, user_id: int) -> str:
         if user_id in self.threads:
             return self.threads[user_id]
-        
+
+        lock = self._thread_locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            # A concurrent warm-up may have created it while we waited
+            if user_id in self.threads:
+                return self.threads[user_id]
+
+            # Survives restarts and other OpenAIService instances
+            async with async_session() as session:
+                row = await session.get(AssistantThread, user_id)
+            if row:
+                self.threads[user_id] = row.thread_id
+                return row.thread_id
+
+            try:
+                thread = await self.client.beta.threads.create()
+                await self._save_thread(user_id, thread.id)
+                return thread.id
+            except Exception as e:
+                logger.error(f"Error creating thread: {e}")
+                raise
+
+    async def _save_thread(self, user_id: int, thread_id: str):
+        """Points the user at a (new) thread and resets its counters."""
+        self.threads[user_id] = thread_id
+        async with async_session() as session:
+            await session.merge(AssistantThread(
+                user_id=user_id, thread_id=thread_id, message_count=0,
+                prompt_tokens=0, created_at=datetime.utcnow(), updated_at=datetime.utcnow()
+            ))
+            await session.commit()
+
+    async def _record_run(self, user_id: int, thread_id: str, usage):
+        """
+        Updates the thread counters after a completed run and rotates the thread
+        once it grows past THREAD_MAX_MESSAGES / THREAD_MAX_PROMPT_TOKENS.
+        """
         try:
-            thread = await self.client.beta.threads.create()
-            self.threads[user_id] = thread.id
-            return thread.id
+            async with async_session() as session:
+                row = await session.get(AssistantThread, user_id)
+                if not row or row.thread_id != thread_id:
+                    return
+                row.message_count += 2 # user + assistant
+                if usage:
+                    # Prompt tokens of the last run ~ current size of the thread
+                    row.prompt_tokens = usage.prompt_tokens
+                row.updated_at = datetime.utcnow()
+                should_rotate = (
+                    row.message_count >= settings.THREAD_MAX_MESSAGES
+                    or row.prompt_tokens >= settings.THREAD_MAX_PROMPT_TOKENS
+                )
+                await session.commit()
+            if should_rotate:
+                # Off the reply path: the user already has the answer
+                asyncio.create_task(self._rotate_thread(user_id, thread_id))
         except Exception as e:
-            logger.error(f"Error creating thread: {e}")
-            raise
+            logger.error(f"Error recording run: {e}")
+
+    async def _rotate_thread(self, user_id: int, old_thread_id: str):
+        """Summarizes the thread and starts a new one seeded with the summary."""
+        # Hold the run lock so no message lands on the old thread mid-rotation
+        async with self._run_locks.setdefault(user_id, asyncio.Lock()):
+            await self._do_rotate_thread(user_id, old_thread_id)
 
-    async def chat(self, user_input: str, garmin_data: dict = None, calendar_events: str = None, tasks_data: str = None, history: list = None, user_id: int = None) -> str:
+    async def _do_rotate_thread(self, user_id: int, old_thread_id: str):
+        try:
+            messages = await self.client.beta.threads.messages.list(thread_id=old_thread_id, limit=100, order="asc")
+            transcript = []
+            for m in messages.data:
+                text = "".join(c.text.value for c in m.content if c.type == "text")
+                transcript.append(f"{'Ariel' if m.role == 'user' else 'JARVISZ'}: {text}")
+
+            response = await self.client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": (
+                        "Resumí esta conversación entre Ariel y JARVISZ en máximo 15 viñetas. "
+                        "Conservá datos personales relevantes, emociones, decisiones, pendientes y acuerdos."
+                    )},
+                    {"role": "user", "content": "\n".join(transcript)}
+                ],
+                temperature=0.2
+            )
+            summary = response.choices[0].message.content
+
+            thread = await self.client.beta.threads.create(messages=[{
+                "role": "assistant",
+                "content": f"[RESUMEN DE LA CONVERSACIÓN ANTERIOR]\n{summary}"
+            }])
+            await self._save_thread(user_id, thread.id)
+            logger.info(f"Thread rotated for {user_id}: {old_thread_id} -> {thread.id} ({len(transcript)} messages summarized)")
+        except Exception as e:
+            logger.error(f"Error rotating thread: {e}")
+
+    async def warm_thread(self, user_id: int):
         """
-        Uses OpenAI Assistants API.
-        'history' argument is ignored as Threads manage history now.
-        'user_id' is required to map to a Thread.
+        Opens the user's Assistant thread ahead of time (speculative, fire and forget).
+        Errors are swallowed: chat_stream() will retry when the thread is really needed.
         """
         if not self.client:
-            return "Error: OpenAI no disponible."
-        
-        if not user_id:
-            return "Error: user_id requerido para Assistant API."
+            return
+        try:
+            await self._get_or_create_thread(user_id)
+        except Exception:
+            pass
 
+    # --- STATIC INSTRUCTIONS (system_prompt_specialist.md) ---
+    def _load_rules(self):
+        """
+        Returns (text, sha256) of system_prompt_specialist.md.
+        Re-read only when the file's mtime changes.
+        If the file cannot be read: (fallback prompt, None).
+        """
+        prompt_path = os.path.join(BASE_DIR, "system_prompt_specialist.md")
         try:
-            # 1. Get Thread
-            thread_id = await self._get_or_create_thread(user_id)
-            
-            # 2. Add Message
-            await self.client.beta.threads.messages.create(
-                thread_id=thread_id,
-                role="user",
-                content=user_input
-            )
-            
-            # 3. Prepare Dynamic Context (Instructions update)
-            tz_argentina = ZoneInfo("America/Argentina/Buenos_Aires")
-            now = datetime.now(tz_argentina)
-            
-            # --- CONSOLIDACIÓN REAL RULES ---
-            # Read from external markdown file for easier editing
+            mtime = os.path.getmtime(prompt_path)
+            if self._rules_cache and self._rules_cache[0] == mtime:
+                return self._rules_cache[1], self._rules_cache[2]
+            with open(prompt_path, "r", encoding="utf-8") as f:
+                 consolidacion_rules = f.read()
+            digest = hashlib.sha256(consolidacion_rules.encode("utf-8")).hexdigest()
+            self._rules_cache = (mtime, consolidacion_rules, digest)
+            return consolidacion_rules, digest
+        except Exception as e:
+            logger.error(f"Error reading system_prompt_specialist.md: {e}")
+            # Fallback minimal prompt (no digest: must never replace the stored instructions)
+            return FALLBACK_RULES, None
+
+    async def sync_instructions(self) -> dict:
+        """
+        Makes the Assistant's stored instructions match system_prompt_specialist.md.
+        The file hash is kept in the Assistant's metadata, so the (large) rules are
+        uploaded only when the file changes, never on every run.
+        Returns a drift report: {"drift": bool, "updated": bool, "file_hash", "stored_hash"}.
+        """
+        if not self.client:
+            return {"drift": None, "updated": False}
+
+        async with self._sync_lock:
+            rules, digest = self._load_rules()
+            if digest is None:
+                # Unreadable file: keep whatever the Assistant has stored
+                return {"drift": None, "updated": False, "error": "system_prompt_specialist.md unreadable"}
+            report = {"drift": False, "updated": False, "file_hash": digest[:12], "stored_hash": None}
             try:
-                base_path = os.getcwd()
-                prompt_path = os.path.join(base_path, "system_prompt_specialist.md")
-                with open(prompt_path, "r", encoding="utf-8") as f:
-                     consolidacion_rules = f.read()
+                assistant = await self.client.beta.assistants.retrieve(self.assistant_id)
+                metadata = dict(assistant.metadata or {})
+                stored_hash = metadata.get("instructions_sha256")
+                report["stored_hash"] = stored_hash[:12] if stored_hash else None
+
+                if stored_hash == digest and assistant.instructions == rules:
+                    self._synced_rules_hash = digest
+                    self._checked_rules_hash = digest
+                    return report
+
+                report["drift"] = True
+                logger.warning(
+                    f"Assistant instructions drift: file {digest[:12]} vs stored "
+                    f"{report['stored_hash']} (text {'differs' if assistant.instructions != rules else 'matches'})"
+                )
+                if not settings.ASSISTANT_SYNC_INSTRUCTIONS:
+                    self._checked_rules_hash = digest
+                    return report
+
+                metadata["instructions_sha256"] = digest
+                await self.client.beta.assistants.update(self.assistant_id, instructions=rules, metadata=metadata)
+                self._synced_rules_hash = digest
+                self._checked_rules_hash = digest
+                report["updated"] = True
+                logger.info(f"Assistant instructions synced from system_prompt_specialist.md ({digest[:12]})")
             except Exception as e:
-                logger.error(f"Error reading system_prompt_specialist.md: {e}")
-                # Fallback minimal prompt
-                consolidacion_rules = "Eres JARVISZ, asistente de Ariel. Sé breve y empático."
-
-            context_str = f"CONTEXTO ACTUAL: {now.strftime('%d/%m/%Y %H:%M')} (Argentina).\n{consolidacion_rules}\n"
-
-            
-            if garmin_data:
-                context_str += f"[BIOMETRÍA]: BB:{garmin_data.get('body_battery')} Stress:{garmin_data.get('stress_avg')}\n"
-            if calendar_events:
-                 context_str += f"[AGENDA]: {calendar_events}\n"
-            if tasks_data:
-                 context_str += f"[TAREAS]: {tasks_data}\n"
-
-            # 4. Run Assistant
-            run = await self.client.beta.threads.runs.create(
-                thread_id=thread_id,
-                assistant_id=self.assistant_id,
-                additional_instructions=context_str
-            )
-            
-            # 5. Poll for completion
+                # Not marked as checked: a later run retries (after SYNC_RETRY_SECONDS)
+                self._sync_retry_at = time.time() + SYNC_RETRY_SECONDS
+                logger.error(f"Error syncing Assistant instructions: {e}")
+                report["error"] = str(e)
+            return report
+
+    async def _ensure_instructions(self) -> bool:
+        """
+        Cheap per-run check (one stat): re-syncs only if the file changed since the last
+        successful check, or a failed sync is due for a retry.
+        Returns True when the stored instructions are current. False (rules inlined in
+        the run) when the file is unreadable.
+        """
+        _, digest = self._load_rules()
+        if digest is None:
+            return False
+        if digest != self._checked_rules_hash and time.time() >= self._sync_retry_at:
+            await self.sync_instructions()
+        return digest == self._synced_rules_hash
+
+    def _build_instructions(self, garmin_data: dict = None, calendar_events: str = None, tasks_data: str = None, include_rules: bool = False, insights: str = None) -> str:
+        """
+        Dynamic context (time, biometrics, trends, agenda, tasks) sent as additional_instructions.
+        The static rules live in the Assistant; they are only appended here when
+        they could not be synced (include_rules=True).
+        """
+        tz_argentina = ZoneInfo("America/Argentina/Buenos_Aires")
+        now = datetime.now(tz_argentina)
+
+        context_str = f"CONTEXTO ACTUAL: {now.strftime('%d/%m/%Y %H:%M')} (Argentina).\n"
+        if include_rules:
+            context_str += f"{self._load_rules()[0]}\n"
+        
+        if garmin_data:
+            context_str += f"[BIOMETRÍA]: BB:{garmin_data.get('body_battery')} Stress:{garmin_data.get('stress_avg')}"
+            if garmin_data.get('fetched_at'):
+                context_str += f" (leído {garmin_data['fetched_at']}, hace {garmin_data.get('age_minutes', 0)} min)"
+            context_str += "\n"
+        if insights:
+            context_str += f"[TENDENCIAS]: {insights}\n"
+        if calendar_events:
+             context_str += f"[AGENDA]: {calendar_events}\n"
+        if tasks_data:
+             context_str += f"[TAREAS]: {tasks_data}\n"
+        return context_str
+
+    async def _add_user_message(self, user_id: int, user_input: str) -> str:
+        """Gets the user's thread and appends the message. Returns thread_id."""
+        thread_id = await self._get_or_create_thread(user_id)
+        await self.client.beta.threads.messages.create(
+            thread_id=thread_id,
+            role="user",
+            content=user_input
+        )
+        return thread_id
+
+    @asynccontextmanager
+    async def _run_slot(self, user_id: int):
+        """
+        Serializes runs per user and applies ASSISTANT_SUPERSEDE_POLICY:
+        - 'cancel': a newer message cancels the run in progress (and skips the run of
+          any message still waiting), so only the newest message gets answered.
+        - 'queue': runs wait their turn, every message gets its answer.
+        Yields the run_info dict of this run ('superseded' tells the caller to stay quiet).
+        """
+        generation = self._run_generation.get(user_id, 0) + 1
+        self._run_generation[user_id] = generation
+        run_info = {"superseded": False}
+        cancel_policy = settings.ASSISTANT_SUPERSEDE_POLICY == "cancel"
+
+        if cancel_policy and user_id in self.active_runs:
+            await self._supersede(self.active_runs[user_id])
+
+        async with self._run_locks.setdefault(user_id, asyncio.Lock()):
+            if cancel_policy and self._run_generation[user_id] != generation:
+                # An even newer message is already waiting behind us
+                run_info["superseded"] = True
+            self.active_runs[user_id] = run_info
+            try:
+                yield run_info
+            finally:
+                if self.active_runs.get(user_id) is run_info:
+                    del self.active_runs[user_id]
+
+    async def _supersede(self, run_info: dict):
+        """Marks a run as superseded and cancels it server-side if it already started."""
+        run_info["superseded"] = True
+        if run_info.get("run_id") and run_info.get("status") == "running":
+            logger.info(f"Cancelling superseded run {run_info['run_id']}")
+            try:
+                await self.client.beta.threads.runs.cancel(run_id=run_info["run_id"], thread_id=run_info["thread_id"])
+            except Exception as e:
+                logger.error(f"Error cancelling superseded run: {e}")
+
+    async def _wait_run_end(self, thread_id: str, run_id: str, timeout: float = 15):
+        """
+        Polls a cancelled run until it leaves 'cancelling': the thread rejects new
+        messages while a run is still active.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            try:
+                run = await self.client.beta.threads.runs.retrieve(run_id=run_id, thread_id=thread_id)
+                if run.status in TERMINAL_RUN_STATUSES:
+                    return
+            except Exception as e:
+                logger.error(f"Error checking run {run_id}: {e}")
+                return
+            await asyncio.sleep(0.5)
+        logger.warning(f"Run {run_id} still active after {timeout}s")
+
+    async def _stream_run(self, thread_id: str, context_str: str, run_info: dict):
+        """
+        Starts a streamed run and yields its text deltas.
+        Completion is driven by the run's own events (no polling), with a hard
+        deadline: when it is hit the run is cancelled server-side.
+        Fills run_info with 'thread_id', 'run_id', 'status' and 'usage'.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.ASSISTANT_RUN_DEADLINE_SECONDS
+        run_info["status"] = "running"
+        run_info["thread_id"] = thread_id
+
+        stream = await self.client.beta.threads.runs.create(
+            thread_id=thread_id,
+            assistant_id=self.assistant_id,
+            additional_instructions=context_str,
+            stream=True
+        )
+        events = stream.__aiter__()
+        try:
             while True:
-                run_status = await self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-                if run_status.status == 'completed':
-                    break
-                elif run_status.status in ['failed', 'cancelled', 'expired']:
-                    return "Algo salió mal procesando tu mensaje."
-                await asyncio.sleep(1) # Wait 1s
-            
-            # 6. Get Messages
-            messages = await self.client.beta.threads.messages.list(
-                thread_id=thread_id,
-                limit=1
-            )
-            
-            # Return the latest message from assistant
-            if messages.data:
-                return messages.data[0].content[0].text.value
-            return "..."
+                try:
+                    event = await asyncio.wait_for(events.__anext__(), timeout=deadline - loop.time())
+                except StopAsyncIteration:
+                    if run_info["status"] == "running":
+                        run_info["status"] = "failed"
+                        if run_info.get("run_id"):
+                            # The stream dropped without a final event: the run may still be active
+                            await self._wait_run_end(thread_id, run_info["run_id"])
+                    return
+                except asyncio.TimeoutError:
+                    run_info["status"] = "timeout"
+                    logger.error(f"Assistant run {run_info.get('run_id')} hit the {settings.ASSISTANT_RUN_DEADLINE_SECONDS}s deadline")
+                    if run_info.get("run_id"):
+                        try:
+                            await self.client.beta.threads.runs.cancel(run_id=run_info["run_id"], thread_id=thread_id)
+                            await self._wait_run_end(thread_id, run_info["run_id"])
+                        except Exception as e:
+                            logger.error(f"Error cancelling run: {e}")
+                    return
 
+                if event.event == "thread.run.created":
+                    run_info["run_id"] = event.data.id
+                    if run_info.get("superseded"):
+                        # A newer message arrived before the run had an id
+                        await self._supersede(run_info)
+                elif event.event == "thread.message.delta":
+                    for part in event.data.delta.content or []:
+                        if part.type == "text" and part.text and part.text.value:
+                            yield part.text.value
+                elif event.event in ("thread.run.completed", "thread.run.incomplete"):
+                    run_info["status"] = "completed"
+                    run_info["usage"] = event.data.usage
+                    return
+                elif event.event in ("thread.run.failed", "thread.run.cancelled", "thread.run.expired", "thread.run.requires_action", "error"):
+                    run_info["status"] = event.event.split(".")[-1]
+                    logger.error(f"Assistant run ended with {event.event}")
+                    if event.event == "thread.run.requires_action":
+                        # No tools are wired here, so the run would hang until it expires
+                        await self.client.beta.threads.runs.cancel(run_id=event.data.id, thread_id=thread_id)
+                        await self._wait_run_end(thread_id, event.data.id)
+                    return
+        finally:
+            await stream.close()
+
+    @staticmethod
+    def _run_error_message(run_info: dict) -> str:
+        if run_info.get("status") == "timeout":
+            return "⏱️ El Especialista tardó demasiado. Probá de nuevo en un rato."
+        return "Algo salió mal procesando tu mensaje."
+
+    async def chat(self, user_input: str, garmin_data: dict = None, calendar_events: str = None, tasks_data: str = None, history: list = None, user_id: int = None, insights: str = None) -> str:
+        """
+        Whole answer of chat_stream() at once (same run path).
+        'history' argument is ignored as Threads manage history now.
+        Returns "" when a newer message superseded this one.
+        """
+        try:
+            parts = [delta async for delta in self.chat_stream(user_input, garmin_data, calendar_events, tasks_data, user_id=user_id, insights=insights)]
+        except RunSuperseded:
+            return ""
+        return "".join(parts) or "..."
+
+    async def chat_stream(self, user_input: str, garmin_data: dict = None, calendar_events: str = None, tasks_data: str = None, user_id: int = None, insights: str = None):
+        """
+        Uses OpenAI Assistants API ('user_id' maps to a Thread). Yields text deltas as
+        the Assistant writes them, so the first paragraph can reach Telegram before
+        the run finishes.
+        Raises RunSuperseded (and stops yielding) as soon as a newer message supersedes the run.
+        """
+        if not self.client:
+            yield "Error: OpenAI no disponible."
+            return
+        
+        if not user_id:
+            yield "Error: user_id requerido para Assistant API."
+            return
+
+        produced = False
+        try:
+            async with self._run_slot(user_id) as run_info:
+                thread_id = await self._add_user_message(user_id, user_input)
+                if run_info["superseded"]:
+                    raise RunSuperseded() # The newer message's run will read this one too
+                rules_synced = await self._ensure_instructions()
+                context_str = self._build_instructions(garmin_data, calendar_events, tasks_data, include_rules=not rules_synced, insights=insights)
+
+                async with aclosing(self._stream_run(thread_id, context_str, run_info)) as deltas:
+                    async for delta in deltas:
+                        if run_info["superseded"]:
+                            # Cancelled server-side by _supersede: stay quiet, but hold the slot
+                            # until the run ends (the thread rejects messages while it is active)
+                            continue
+                        produced = True
+                        yield delta
+
+            if run_info["superseded"]:
+                raise RunSuperseded()
+            if run_info["status"] == "completed":
+                await self._record_run(user_id, thread_id, run_info.get("usage"))
+            elif not produced:
+                yield self._run_error_message(run_info)
+
+        except RunSuperseded:
+            raise
         except Exception as e:
-            logger.error(f"Assistant Chat Error: {e}")
-            return f"Hubo un error con el Agente: {e}"
+            logger.error(f"Assistant Stream Error: {e}")
+            if not produced:
+                yield f"Hubo un error con el Agente: {e}"
 
     async def analyze_checkin(self, context_data: dict, user_input: str) -> str:
         """
@@ -144,11 +500,28 @@ class OpenAIService:
             logger.error(f"Checkin Analysis Error: {e}")
             return "Recibido. (Error analizando)"
 
-    async def route_traffic(self, user_input: str) -> dict:
+    def route_local(self, user_input: str) -> dict:
+        """
+        LOCAL ROUTER (sub-millisecond, no API call).
+        1. Cached LLM decision for the same (normalized) message.
+        2. Classifier decision, only when it is confident enough.
+        Otherwise None and the caller falls back to route_traffic().
+        """
+        cached = route_cache.get(user_input)
+        if cached:
+            return cached
+
+        prediction = self.intent_classifier.predict(user_input)
+        if prediction and prediction["confidence"] >= settings.INTENT_CLASSIFIER_THRESHOLD:
+            return prediction
+        return None
+
+    async def route_traffic(self, user_input: str, use_cache: bool = True) -> dict:
         """
         TRAFFIC CONTROLLER (ROUTER).
         Uses gpt-4o-mini (Cheap) to decide who handles the message.
-        Returns JSON: {"destination": "casual"|"management"|"consultant", "confidence": float}
+        use_cache=False (offline labelling) keeps the call out of the route cache and its stats.
+        Returns JSON: {"destination": "casual"|"management"|"breakdown"|"consultant", "source": "llm"|"fallback"}
         """
         system_prompt = """
         Sos el Router de JARVISZ. Tu única tarea es clasificar el mensaje del usuario para ahorrar costos.
@@ -162,6 +535,7 @@ class OpenAIService:
         Responded ONLY with JSON: {"destination": "..."}
         """
         try:
+            started = time.monotonic()
             response = await self.client.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=[
@@ -170,12 +544,18 @@ class OpenAIService:
                 ],
                 temperature=0.0
             )
+            if use_cache:
+                route_cache.record_router_call(time.monotonic() - started, response.usage)
             import json
             content = response.choices[0].message.content.replace("```json", "").replace("```", "").strip()
-            return json.loads(content)
+            result = json.loads(content)
+            result["source"] = "llm"
+            if use_cache:
+                route_cache.put(user_input, result.get("destination", "consultant"))
+            return result
         except Exception as e:
             logger.error(f"Router Error: {e}")
-            return {"destination": "consultant"} # Default to powerful agent if unsure
+            return {"destination": "consultant", "source": "fallback"} # Default to powerful agent if unsure
 
     async def casual_chat(self, user_input: str) -> str:
         """
@@ -195,6 +575,28 @@ class OpenAIService:
         except Exception as e:
             return "Hola! (Error simple)"
 
+    async def casual_chat_stream(self, user_input: str):
+        """Streaming version of casual_chat(): yields text deltas."""
+        system_prompt = "Sos JARVISZ, un asistente amable y breve. Respondé con onda pero corto."
+        produced = False
+        try:
+            stream = await self.client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_input}
+                ],
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    produced = True
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            logger.error(f"Casual Stream Error: {e}")
+            if not produced:
+                yield "Hola! (Error simple)"
+
     async def extract_management_data(self, user_input: str, now_iso: str) -> str:
         """
         MANAGEMENT SPECIALIST (JSON Extractor).
@@ -204,9 +606,10 @@ class OpenAIService:
         Sos el Especialista de Gestión. HOY: {now_iso}.
         Extraer datos JSON para Calendar/Tasks.
         
-        ACCIONES: "create_event", "delete_event", "create_task", "delete_task", "read_calendar", "read_tasks".
+        ACCIONES: "create_event", "delete_event", "create_task", "delete_task", "read_calendar", "read_tasks", "find_slot".
+        "find_slot" = el usuario busca un hueco libre ("¿cuándo tengo un hueco?"). Incluir "duration_minutes" (default 60) y "days_ahead" (default 7).
         
-        JSON: {{ "action": "...", "summary": "...", "start_time": "..." }}
+        JSON: {{ "action": "...", "summary": "...", "start_time": "...", "duration_minutes": 60, "days_ahead": 7 }}
         """
         try:
             response = await self.client.chat.completions.create(
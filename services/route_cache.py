@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, select
+from config import settings
+from database.db import async_session
+from database.models import RouteCacheEntry
+from services.text_utils import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# gpt-4o-mini list price (USD per 1M tokens), only used for the savings estimate
+ROUTER_PRICE_INPUT = 0.15
+ROUTER_PRICE_OUTPUT = 0.60
+
+
+class RouteCache:
+    """
+    LRU + TTL cache of LLM router decisions, keyed by the normalized message
+    ("Agenda!!" == "agenda"). Lives in memory and is written through to SQLite
+    so it survives restarts.
+    """
+
+    def __init__(self):
+        self.max_entries = settings.ROUTE_CACHE_MAX_ENTRIES
+        self.ttl = settings.ROUTE_CACHE_TTL_HOURS * 3600
+        self.entries = OrderedDict() # key -> (destination, created_at epoch)
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.router_calls = 0
+        self.router_seconds = 0.0
+        self.router_prompt_tokens = 0
+        self.router_completion_tokens = 0
+
+    @staticmethod
+    def make_key(text: str):
+        """Normalized key, or None for long (unlikely to repeat) messages."""
+        key = normalize_text(text)
+        if not key or len(key) > settings.ROUTE_CACHE_MAX_KEY_CHARS:
+            return None
+        return key
+
+    def get(self, text: str):
+        key = self.make_key(text)
+        if key is None:
+            return None
+        entry = self.entries.get(key)
+        if entry and time.time() - entry[1] < self.ttl:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return {"destination": entry[0], "source": "cache"}
+        if entry:
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, text: str, destination: str):
+        key = self.make_key(text)
+        if key is None:
+            return
+        created_at = time.time()
+        self.entries[key] = (destination, created_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        # Write-through (fire and forget)
+        asyncio.create_task(self._persist(key, destination, created_at))
+
+    def record_router_call(self, seconds: float, usage=None):
+        """Called on every real LLM router call, to price what a hit saves."""
+        self.router_calls += 1
+        self.router_seconds += seconds
+        if usage:
+            self.router_prompt_tokens += usage.prompt_tokens
+            self.router_completion_tokens += usage.completion_tokens
+
+    def stats(self) -> dict:
+        calls = self.router_calls or 1
+        avg_seconds = self.router_seconds / calls
+        avg_cost = (
+            self.router_prompt_tokens * ROUTER_PRICE_INPUT
+            + self.router_completion_tokens * ROUTER_PRICE_OUTPUT
+        ) / 1_000_000 / calls
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_router_seconds": avg_seconds,
+            "saved_seconds": self.hits * avg_seconds,
+            "saved_usd": self.hits * avg_cost,
+        }
+
+    # --- Persistence ---
+    async def _persist(self, key: str, destination: str, created_at: float):
+        try:
+            async with async_session() as session:
+                await session.merge(RouteCacheEntry(
+                    key=key, destination=destination,
+                    created_at=datetime.fromtimestamp(created_at, timezone.utc).replace(tzinfo=None)
+                ))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Route cache persist error: {e}")
+
+    async def load(self):
+        """Loads the non-expired entries from SQLite (call once at startup)."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        try:
+            async with async_session() as session:
+                await session.execute(delete(RouteCacheEntry).where(RouteCacheEntry.created_at < cutoff))
+                await session.commit()
+                result = await session.execute(
+                    select(RouteCacheEntry)
+                    .order_by(RouteCacheEntry.created_at.desc())
+                    .limit(self.max_entries)
+                )
+                rows = result.scalars().all()
+            # Oldest first, so the newest end up at the MRU end
+            for row in reversed(rows):
+                self.entries[row.key] = (row.destination, row.created_at.replace(tzinfo=timezone.utc).timestamp())
+            logger.info(f"Route cache loaded: {len(self.entries)} entries")
+        except Exception as e:
+            logger.error(f"Route cache load error: {e}")
+
+
+route_cache = RouteCache()
@@ -0,0 +1,5 @@
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+# Process-wide scheduler for background jobs (Garmin refresh, ingestion).
+# Services add their jobs at startup; main.py starts and stops it.
+scheduler = AsyncIOScheduler()
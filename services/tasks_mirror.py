@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from config import settings
+from database.db import async_session
+from database.models import TaskListMirror, TaskMirrorItem
+from services.fuzzy_index import FuzzyIndex
+
+logger = logging.getLogger(__name__)
+
+# Overlap between deltas, so a clock skew with Google never loses an update
+DELTA_OVERLAP = timedelta(seconds=60)
+
+
+class TasksMirror:
+    """
+    Local copy of the pending tasks of every task list.
+    - First sync of a list downloads its pending tasks.
+    - After that only tasks.list?updatedMin=<last sync> is asked for: completed,
+      hidden or deleted tasks leave the mirror, the rest are upserted.
+    - Our own mutations (create/delete) are applied right away.
+    Reads go through ensure_fresh(), which only talks to Google when the mirror is
+    older than TASKS_MIRROR_MAX_STALENESS_SECONDS.
+    """
+
+    def __init__(self):
+        self.lists = []   # [{"id", "title"}] in Google's order
+        self.tasks = {}   # list_id -> {task_id: task dict}
+        self.watermarks = {} # list_id -> updatedMin of the next delta (naive UTC)
+        self.synced_at = None # Last complete refresh (naive UTC)
+        self.index = FuzzyIndex() # (list_id, task_id) over titles
+        self._sync_lock = asyncio.Lock()
+
+    # --- Reads ---
+    def age(self):
+        if self.synced_at is None:
+            return None
+        return (datetime.utcnow() - self.synced_at).total_seconds()
+
+    async def ensure_fresh(self, max_staleness: float = None):
+        """Syncs first if the mirror is older than the staleness bound. Raises if it cannot."""
+        bound = settings.TASKS_MIRROR_MAX_STALENESS_SECONDS if max_staleness is None else max_staleness
+        age = self.age()
+        if age is None or age > bound:
+            await self.sync()
+
+    def pending(self, list_id: str) -> list:
+        """Pending tasks of a list, in the list's order."""
+        return sorted(self.tasks.get(list_id, {}).values(), key=lambda t: t.get('position', ''))
+
+    def search(self, query: str) -> list:
+        """Pending tasks matching query (fuzzy), best first: [(task, list_id)]."""
+        return [(self.tasks[list_id][task_id], list_id) for _, (list_id, task_id) in self.index.search(query)]
+
+    # --- Local Changes ---
+    @staticmethod
+    def _is_pending(task: dict) -> bool:
+        return not task.get('deleted') and not task.get('hidden') and task.get('status') != 'completed'
+
+    def _put(self, list_id: str, task: dict):
+        self.tasks.setdefault(list_id, {})[task['id']] = task
+        self.index.add((list_id, task['id']), task.get('title', ''))
+
+    def _drop(self, list_id: str, task_id: str):
+        self.tasks.get(list_id, {}).pop(task_id, None)
+        self.index.remove((list_id, task_id))
+
+    def _drop_list(self, list_id: str):
+        for task_id in list(self.tasks.get(list_id, {})):
+            self._drop(list_id, task_id)
+        self.tasks.pop(list_id, None)
+
+    async def apply_local(self, list_id: str, task: dict, deleted: bool = False):
+        """Mirrors our own create/delete without waiting for the next delta."""
+        if deleted:
+            self._drop(list_id, task['id'])
+            await self._persist(list_id, [], [task['id']])
+        else:
+            self._put(list_id, task)
+            await self._persist(list_id, [task], [])
+
+    # --- Sync ---
+    async def _sync_list(self, tasks_service, list_id: str, started: datetime):
+        watermark = self.watermarks.get(list_id)
+        if watermark is None:
+            items = [t async for t in tasks_service.iter_tasks(list_id)]
+            self._drop_list(list_id)
+            replace = True
+        else:
+            items = [t async for t in tasks_service.iter_tasks(
+                list_id, updated_min=watermark - DELTA_OVERLAP, show_completed=True, show_deleted=True
+            )]
+            replace = False
+
+        changed, removed = [], []
+        self.tasks.setdefault(list_id, {})
+        for task in items:
+            if self._is_pending(task):
+                self._put(list_id, task)
+                changed.append(task)
+            else:
+                self._drop(list_id, task['id'])
+                removed.append(task['id'])
+
+        self.watermarks[list_id] = started
+        await self._persist(list_id, changed, removed, replace=replace)
+        if items and not replace:
+            logger.info(f"Tasks mirror: list {list_id} delta +{len(changed)} -{len(removed)}")
+
+    async def sync(self):
+        """Refreshes task lists and pulls task changes of every list."""
+        async with self._sync_lock:
+            # Another caller may have synced while we waited for the lock
+            age = self.age()
+            if age is not None and age < 1:
+                return
+            from services.tasks_service import TasksService
+            tasks_service = TasksService()
+            if not await tasks_service.authenticate():
+                raise RuntimeError("No tasks access")
+            started = datetime.utcnow()
+
+            res = await tasks_service.service.get("/users/@me/lists", maxResults=100)
+            lists = [{"id": l['id'], "title": l['title']} for l in res.get('items', [])]
+
+            # Removed lists
+            for list_id in set(self.tasks) - {l['id'] for l in lists}:
+                self._drop_list(list_id)
+                self.watermarks.pop(list_id, None)
+                await self._persist(list_id, [], [], replace=True, forget=True)
+            self.lists = lists
+
+            await asyncio.gather(*(self._sync_list(tasks_service, l['id'], started) for l in lists))
+            await self._persist_lists()
+            self.synced_at = started
+
+    async def refresh_loop(self):
+        """Background task: keeps the mirror within its staleness bound without a request waiting."""
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Tasks mirror refresh failed: {e}")
+            await asyncio.sleep(settings.TASKS_SYNC_INTERVAL_SECONDS)
+
+    # --- Persistence ---
+    async def _persist(self, list_id: str, changed: list, removed: list, replace=False, forget=False):
+        try:
+            async with async_session() as session:
+                if replace:
+                    await session.execute(delete(TaskMirrorItem).where(TaskMirrorItem.list_id == list_id))
+                elif removed:
+                    await session.execute(delete(TaskMirrorItem).where(
+                        TaskMirrorItem.list_id == list_id, TaskMirrorItem.task_id.in_(removed)
+                    ))
+                for task in changed:
+                    await session.merge(TaskMirrorItem(
+                        list_id=list_id, task_id=task['id'], data=json.dumps(task, ensure_ascii=False)
+                    ))
+                if forget:
+                    await session.execute(delete(TaskListMirror).where(TaskListMirror.list_id == list_id))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Tasks mirror persist error: {e}")
+
+    async def _persist_lists(self):
+        try:
+            async with async_session() as session:
+                for position, l in enumerate(self.lists):
+                    await session.merge(TaskListMirror(
+                        list_id=l['id'], title=l['title'], position=position,
+                        synced_at=self.watermarks.get(l['id'])
+                    ))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Tasks mirror persist error: {e}")
+
+    async def load(self):
+        """Loads lists, tasks and watermarks from SQLite (call once at startup)."""
+        try:
+            async with async_session() as session:
+                lists = (await session.execute(select(TaskListMirror).order_by(TaskListMirror.position))).scalars().all()
+                rows = (await session.execute(select(TaskMirrorItem))).scalars().all()
+            self.lists = [{"id": l.list_id, "title": l.title} for l in lists]
+            for l in lists:
+                self.tasks[l.list_id] = {}
+                if l.synced_at:
+                    self.watermarks[l.list_id] = l.synced_at
+            for row in rows:
+                if row.list_id in self.tasks:
+                    self._put(row.list_id, json.loads(row.data))
+            if lists and all(l.synced_at for l in lists):
+                self.synced_at = min(l.synced_at for l in lists)
+            logger.info(f"Tasks mirror loaded: {len(lists)} lists, {len(rows)} tasks")
+        except Exception as e:
+            logger.error(f"Tasks mirror load error: {e}")
+
+
+tasks_mirror = TasksMirror()
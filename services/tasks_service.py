@@ -1,125 +1,89 @@
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-import os.path
 import logging
-from datetime import datetime, timedelta
+from urllib.parse import quote
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
+from services.google_clients import google_clients
+from services.tasks_mirror import tasks_mirror
 
 logger = logging.getLogger(__name__)
 
-# If modifying these scopes, delete the file token_tasks.json.
-SCOPES = ['https://www.googleapis.com/auth/tasks']
+
+def _rfc3339(dt: datetime) -> str:
+    """Naive datetimes are taken as UTC."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
 
 class TasksService:
     def __init__(self):
-        self.creds = None
         self.service = None
-        
-    def authenticate(self):
-        """Authenticate with Google Tasks API."""
-        # Calculate absolute paths - Fixes the Relative Path Bug
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        token_path = os.path.join(base_dir, 'token_tasks.json')
-        creds_path = os.path.join(base_dir, 'credentials.json')
-        
-        logger.info(f"Authenticating Tasks Service. Token path: {token_path}, Creds path: {creds_path}")
-
-        # 1. Try Environment Variables (Priority for Server)
-        # Check for specific Tasks token, otherwise reuse generic or calendar token logic if user prefers, 
-        # but sticking to plan: check GOOGLE_TOKEN_TASKS_JSON
-        env_token_json = os.environ.get('GOOGLE_TOKEN_TASKS_JSON')
-        # Fallback to generic if specific not found (optional, but helpful if they are same account)
-        if not env_token_json:
-             env_token_json = os.environ.get('GOOGLE_TOKEN_JSON')
-
-        env_creds_json = os.environ.get('GOOGLE_CREDENTIALS_JSON')
-
-        if env_token_json:
-            try:
-                import json
-                info = json.loads(env_token_json)
-                self.creds = Credentials.from_authorized_user_info(info, SCOPES)
-                logger.info("Loaded Tasks credentials from Env Var.")
-            except Exception as e:
-                logger.error(f"Failed to load tasks token from env var: {e}")
-                self.creds = None
-
-        # 2. Try Local File
-        if not self.creds and os.path.exists(token_path):
-            try:
-                self.creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-                logger.info("Loaded Tasks credentials from local file.")
-            except Exception:
-                self.creds = None
-        
-        # If there are no (valid) credentials available, let the user log in.
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                try:
-                    self.creds.refresh(Request())
-                    logger.info("Refreshed Tasks token.")
-                except Exception as e:
-                    logger.error(f"Error refreshing token: {e}")
-                    self.creds = None
-            
-            if not self.creds:
-                # Try to get client config from Env Var or File
-                client_config = None
-                
-                if env_creds_json:
-                     try:
-                        import json
-                        client_config = json.loads(env_creds_json)
-                        logger.info("Loaded Client Config from GOOGLE_CREDENTIALS_JSON env var.")
-                     except Exception as e:
-                        logger.error(f"Failed to parse creds env var: {e}")
-
-                if client_config:
-                     try:
-                        flow = InstalledAppFlow.from_client_config(client_config, SCOPES)
-                        self.creds = flow.run_local_server(port=0)
-                     except Exception as e:
-                         logger.error(f"Failed flow from client config: {e}") # Likely to fail on headless server without token
-
-                elif os.path.exists(creds_path):
-                    try:
-                        flow = InstalledAppFlow.from_client_secrets_file(
-                            creds_path, SCOPES)
-                        # Run local server for auth
-                        self.creds = flow.run_local_server(port=0)
-                        # Save the credentials for the next run
-                        with open(token_path, 'w') as token:
-                            token.write(self.creds.to_json())
-                        logger.info("Generated new token_tasks.json locally.")
-                    except Exception as e:
-                        logger.error(f"Failed to auth flow: {e}")
-                        return False
-                else:
-                    logger.warning("No credentials found. Tasks disabled.")
-                    return False
 
+    async def authenticate(self):
+        """Attaches the shared Tasks client (async, keep-alive, built once per process)."""
+        client = google_clients.get("tasks")
+        if not await client.ensure_credentials():
+            return False
+        self.service = client
+        return True
+
+    async def iter_tasks(self, list_id, due_min=None, due_max=None, show_completed=False,
+                         updated_min=None, show_deleted=False, limit=None, page_size=100):
+        """
+        Streams the tasks of a list, following nextPageToken.
+        Filters (due range, completed, updatedMin) are applied by Google, and only
+        one page (page_size tasks) is held in memory at a time.
+        """
+        if not self.service:
+            if not await self.authenticate():
+                return
+        page_token = None
+        yielded = 0
+        while True:
+            res = await self.service.get(
+                f"/lists/{quote(list_id, safe='')}/tasks",
+                pageToken=page_token,
+                maxResults=min(page_size, limit - yielded) if limit else page_size,
+                dueMin=_rfc3339(due_min) if due_min else None,
+                dueMax=_rfc3339(due_max) if due_max else None,
+                updatedMin=_rfc3339(updated_min) if updated_min else None,
+                showCompleted=show_completed,
+                showHidden=show_completed,
+                showDeleted=show_deleted
+            )
+            for task in res.get('items', []):
+                yield task
+                yielded += 1
+                if limit and yielded >= limit:
+                    return
+            page_token = res.get('nextPageToken')
+            if not page_token:
+                return
+
+    async def _task_lists(self):
+        """
+        (lists, from_mirror): task lists from the mirror (synced first if stale),
+        or straight from Google when the mirror cannot sync.
+        """
         try:
-            self.service = build('tasks', 'v1', credentials=self.creds)
-            logger.info("Tasks service initialized successfully.")
-            return True
+            await tasks_mirror.ensure_fresh()
+            return tasks_mirror.lists, True
         except Exception as e:
-            logger.error(f"Failed to build tasks service: {e}")
-            return False
+            logger.warning(f"Tasks mirror unavailable, reading from Google: {e}")
+            res = await self.service.get("/users/@me/lists", maxResults=100)
+            return [{"id": l['id'], "title": l['title']} for l in res.get('items', [])], False
 
-    def get_all_tasks(self, max_results=20):
+    async def get_all_tasks(self, max_results=20):
         """Get all pending tasks from all task lists."""
         if not self.service:
-            if not self.authenticate():
+            if not await self.authenticate():
                 return "No tasks access"
 
         try:
             all_tasks = []
             
-            # Get all task lists
-            task_lists = self.service.tasklists().list().execute()
-            lists = task_lists.get('items', [])
+            # Task lists and pending tasks come from the local mirror
+            lists, from_mirror = await self._task_lists()
             
             if not lists:
                 return "Sin listas de tareas"
@@ -129,14 +93,10 @@ class TasksService:
                 list_id = task_list['id']
                 list_name = task_list['title']
                 
-                tasks_result = self.service.tasks().list(
-                    tasklist=list_id,
-                    maxResults=max_results,
-                    showCompleted=False,
-                    showHidden=False
-                ).execute()
-                
-                tasks = tasks_result.get('items', [])
+                if from_mirror:
+                    tasks = tasks_mirror.pending(list_id)[:max_results]
+                else:
+                    tasks = [t async for t in self.iter_tasks(list_id, limit=max_results)]
                 
                 for task in tasks:
                     task_title = task.get('title', 'Sin título')
@@ -165,28 +125,17 @@ class TasksService:
             logger.error(f"Tasks fetch error: {e}")
             return "ErrorTasks"
 
-    def create_task(self, title: str, notes: str = None, due_date: datetime = None, list_name: str = None):
+    async def create_task(self, title: str, notes: str = None, due_date: datetime = None, list_name: str = None):
         """Create a new task in Google Tasks."""
         if not self.service:
-            if not self.authenticate():
+            if not await self.authenticate():
                 return False, "No tasks access"
 
         try:
-            # Get task lists
-            task_lists = self.service.tasklists().list().execute()
-            lists = task_lists.get('items', [])
-            
-            if not lists:
+            target_list_id = await self._resolve_list(list_name)
+            if not target_list_id:
                 return False, "No hay listas de tareas disponibles"
             
-            # Find the specified list or use the first one
-            target_list_id = lists[0]['id']
-            if list_name:
-                for task_list in lists:
-                    if task_list['title'].lower() == list_name.lower():
-                        target_list_id = task_list['id']
-                        break
-            
             # Create task object
             task = {
                 'title': title,
@@ -200,11 +149,12 @@ class TasksService:
                 task['due'] = due_date.isoformat()
             
             # Insert the task
-            result = self.service.tasks().insert(
-                tasklist=target_list_id,
+            result = await self.service.request(
+                "POST", f"/lists/{quote(target_list_id, safe='')}/tasks",
                 body=task
-            ).execute()
+            )
             
+            await tasks_mirror.apply_local(target_list_id, result)
             logger.info(f"Task created: {title}")
             return True, f"✅ Tarea creada: {title}"
 
@@ -212,21 +162,129 @@ class TasksService:
             logger.error(f"Task creation error: {e}")
             return False, f"Error al crear tarea: {e}"
 
-    def get_todays_tasks(self):
+    async def create_tasks(self, titles: list, list_name: str = None, parent_title: str = None, due_dates: list = None):
+        """
+        Creates several tasks with one batch request (the list is resolved once), in the
+        order given. parent_title: optional parent task; the titles become its subtasks
+        (it is deleted again when none of them could be created).
+        due_dates: optional datetime (or None) per title.
+        Returns (created_count, message).
+        """
+        if not self.service:
+            if not await self.authenticate():
+                return 0, "No tasks access"
+
+        try:
+            target_list_id = await self._resolve_list(list_name)
+            if not target_list_id:
+                return 0, "No hay listas de tareas disponibles"
+            list_path = f"/lists/{quote(target_list_id, safe='')}/tasks"
+
+            params, parent = None, None
+            if parent_title:
+                # The parent id is needed by every subtask insert, so it goes first
+                parent = await self.service.request("POST", list_path, body={'title': parent_title})
+                await tasks_mirror.apply_local(target_list_id, parent)
+                params = {'parent': parent['id']}
+
+            calls = []
+            for i, title in enumerate(titles):
+                task = {'title': title}
+                due_date = due_dates[i] if due_dates and i < len(due_dates) else None
+                if due_date:
+                    task['due'] = _rfc3339(due_date)
+                calls.append(("POST", list_path, params, task))
+
+            # Each insert lands on top of its list, so they are sent last-to-first
+            try:
+                results = list(reversed(await self.service.batch(calls[::-1])))
+            except Exception:
+                await self._discard_parent(target_list_id, parent)
+                raise
+            created_tasks = []
+            for status, result in results:
+                if status == 200:
+                    created_tasks.append(result)
+                else:
+                    logger.error(f"Bulk task insert failed ({status}): {result}")
+
+            if not created_tasks:
+                await self._discard_parent(target_list_id, parent)
+                return 0, f"⚠️ No se pudo crear ninguna de las {len(titles)} tareas."
+
+            # Batch parts may run in any order: put the steps back in order if they were shuffled
+            created_tasks = await self._keep_order(list_path, created_tasks, params)
+            for task in created_tasks:
+                await tasks_mirror.apply_local(target_list_id, task)
+
+            created = len(created_tasks)
+            logger.info(f"Bulk tasks created: {created}/{len(titles)}")
+            if created == len(titles):
+                return created, f"✅ {created} tareas creadas" + (f" en '{parent_title}'" if parent_title else "")
+            return created, f"⚠️ Se crearon {created} de {len(titles)} tareas."
+
+        except Exception as e:
+            logger.error(f"Bulk task creation error: {e}")
+            return 0, f"Error al crear tareas: {e}"
+
+    async def _keep_order(self, list_path: str, tasks: list, params: dict = None) -> list:
+        """
+        Makes the list show tasks in the given order. Positions come back with each
+        insert, so this costs nothing when the batch ran in order; otherwise every task
+        is moved after its predecessor, one call at a time (moves depend on each other).
+        """
+        positions = [t.get('position', '') for t in tasks]
+        if positions == sorted(positions):
+            return tasks
+        logger.info("Bulk tasks came back shuffled, restoring the order")
+        ordered, previous = [], None
+        for task in tasks:
+            move_params = dict(params or {})
+            if previous:
+                move_params['previous'] = previous
+            moved = await self.service.request("POST", f"{list_path}/{quote(task['id'], safe='')}/move", params=move_params)
+            ordered.append(moved or task)
+            previous = task['id']
+        return ordered
+
+    async def _discard_parent(self, list_id: str, parent: dict = None):
+        """Removes a parent task that ended up without subtasks."""
+        if not parent:
+            return
+        try:
+            await self.service.request("DELETE", f"/lists/{quote(list_id, safe='')}/tasks/{quote(parent['id'], safe='')}")
+            await tasks_mirror.apply_local(list_id, parent, deleted=True)
+        except Exception as e:
+            logger.error(f"Could not remove empty parent task '{parent.get('title')}': {e}")
+
+    async def _resolve_list(self, list_name: str = None):
+        """Id of the list named list_name, else the first list (None when there are no lists)."""
+        lists, _ = await self._task_lists()
+        if not lists:
+            return None
+        if list_name:
+            for task_list in lists:
+                if task_list['title'].lower() == list_name.lower():
+                    return task_list['id']
+        return lists[0]['id']
+
+    async def get_todays_tasks(self):
         """Get tasks due today."""
         if not self.service:
-            if not self.authenticate():
+            if not await self.authenticate():
                 return "No tasks access"
 
         try:
             tz_argentina = ZoneInfo("America/Argentina/Buenos_Aires")
             today = datetime.now(tz_argentina).date()
+            # Google Tasks keeps only the due date, as midnight UTC of that day
+            due_min = datetime(today.year, today.month, today.day)
+            due_max = due_min + timedelta(days=1) - timedelta(seconds=1)
             
             all_tasks = []
             
-            # Get all task lists
-            task_lists = self.service.tasklists().list().execute()
-            lists = task_lists.get('items', [])
+            # Task lists and pending tasks come from the local mirror
+            lists, from_mirror = await self._task_lists()
             
             if not lists:
                 return "Sin listas de tareas"
@@ -236,27 +294,18 @@ class TasksService:
                 list_id = task_list['id']
                 list_name = task_list['title']
                 
-                tasks_result = self.service.tasks().list(
-                    tasklist=list_id,
-                    showCompleted=False,
-                    showHidden=False
-                ).execute()
-                
-                tasks = tasks_result.get('items', [])
+                if from_mirror:
+                    tasks = [t for t in tasks_mirror.pending(list_id) if (t.get('due') or '')[:10] == today.isoformat()]
+                else:
+                    # Only today's tasks are transferred (server-side due filter)
+                    tasks = [t async for t in self.iter_tasks(list_id, due_min=due_min, due_max=due_max)]
                 
                 for task in tasks:
-                    due_date = task.get('due', None)
-                    
-                    if due_date:
-                        due_dt = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-                        due_dt_local = due_dt.astimezone(tz_argentina).date()
-                        
-                        if due_dt_local == today:
-                            task_title = task.get('title', 'Sin título')
-                            task_info = f"📋 {task_title}"
-                            if list_name != "My Tasks":
-                                task_info += f" [{list_name}]"
-                            all_tasks.append(task_info)
+                    task_title = task.get('title', 'Sin título')
+                    task_info = f"📋 {task_title}"
+                    if list_name != "My Tasks":
+                        task_info += f" [{list_name}]"
+                    all_tasks.append(task_info)
             
             if not all_tasks:
                 return "Sin tareas para hoy"
@@ -267,28 +316,24 @@ class TasksService:
             logger.error(f"Tasks fetch error: {e}")
             return "ErrorTasks"
 
-    def find_task(self, query):
-        """Finds first pending task matching query."""
+    async def find_task(self, query):
+        """Finds the pending task that best matches query."""
         if not self.service:
-            if not self.authenticate():
+            if not await self.authenticate():
                 return None, "No auth"
 
         try:
-            task_lists = self.service.tasklists().list().execute()
-            lists = task_lists.get('items', [])
+            lists, from_mirror = await self._task_lists()
+            if from_mirror:
+                # Fuzzy index: accent/typo tolerant, ranked
+                matches = tasks_mirror.search(query)
+                return matches[0] if matches else (None, None)
             
             query = query.lower()
             
             for task_list in lists:
                 list_id = task_list['id']
-                tasks_result = self.service.tasks().list(
-                    tasklist=list_id,
-                    showCompleted=False,
-                    showHidden=False
-                ).execute()
-                
-                tasks = tasks_result.get('items', [])
-                for task in tasks:
+                async for task in self.iter_tasks(list_id):
                     title = task.get('title', '').lower()
                     if query in title:
                         return task, list_id
@@ -297,12 +342,13 @@ class TasksService:
             logger.error(f"Search task error: {e}")
             return None, None
 
-    def delete_task(self, task_id, list_id):
+    async def delete_task(self, task_id, list_id):
         if not self.service:
-            if not self.authenticate():
+            if not await self.authenticate():
                 return False
         try:
-            self.service.tasks().delete(tasklist=list_id, task=task_id).execute()
+            await self.service.request("DELETE", f"/lists/{quote(list_id, safe='')}/tasks/{quote(task_id, safe='')}")
+            await tasks_mirror.apply_local(list_id, {"id": task_id}, deleted=True)
             return True
         except Exception as e:
             logger.error(f"Delete task error: {e}")
@@ -0,0 +1,27 @@
+import re
+import unicodedata
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Folds case, accents, punctuation and whitespace.
+    "¡Hola!  ¿Qué tengo HOY?" -> "hola que tengo hoy"
+    """
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _PUNCT_RE.sub(" ", text).replace("_", " ")
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def char_ngrams(text: str, n: int = 3) -> list:
+    """Character n-grams of each word, padded with spaces ("hoy" -> " ho", "hoy", "oy ")."""
+    grams = []
+    for word in text.split():
+        padded = f" {word} "
+        grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
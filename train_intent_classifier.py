@@ -0,0 +1,165 @@
+"""
+Entrena el router local (TF-IDF + regresión logística) a partir de interaction_logs/
+e imprime un reporte de evaluación contra el router LLM.
+
+Uso:
+    python train_intent_classifier.py
+    python train_intent_classifier.py --label-with-router   # etiqueta lo que falte con gpt-4o-mini
+    python train_intent_classifier.py --threshold 0.85 --logs interaction_logs test_logs
+"""
+import argparse
+import asyncio
+import json
+import random
+from pathlib import Path
+from config import settings
+from services.intent_classifier import IntentClassifier, load_labeled_messages, evaluate
+
+ROUTER_LABELS_PATH = Path("data/router_labels.json")
+
+
+def load_router_labels() -> dict:
+    if ROUTER_LABELS_PATH.exists():
+        with open(ROUTER_LABELS_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_router_labels(labels: dict):
+    ROUTER_LABELS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(ROUTER_LABELS_PATH, "w", encoding="utf-8") as f:
+        json.dump(labels, f, ensure_ascii=False, indent=2)
+
+
+async def label_with_router(messages: dict, cached: dict) -> dict:
+    """Asks the LLM router for every message without a router label (results are cached)."""
+    from services.openai_service import OpenAIService
+    ai = OpenAIService()
+    pending = [key for key, m in messages.items() if not m["router"] and key not in cached]
+    print(f"🤖 Etiquetando {len(pending)} mensajes con el router LLM...")
+
+    semaphore = asyncio.Semaphore(4)
+
+    async def label(key):
+        async with semaphore:
+            # Offline traffic: never written into the production route cache
+            result = await ai.route_traffic(messages[key]["text"], use_cache=False)
+            if result.get("source") == "llm":
+                cached[key] = result["destination"]
+
+    await asyncio.gather(*(label(key) for key in pending))
+    save_router_labels(cached)
+    return cached
+
+
+def cross_validate(items: list, reference: str, threshold: float, folds: int = 5) -> dict:
+    """
+    K-fold: trains on the other folds and compares held-out predictions with
+    items[i][reference] ('router' or 'gold').
+    """
+    scored = [i for i, item in enumerate(items) if item[reference]]
+    if len(scored) < folds:
+        return {"n": len(scored)}
+
+    rng = random.Random(42)
+    rng.shuffle(scored)
+    totals = {"n": 0, "correct": 0, "covered": 0, "covered_correct": 0, "latency_ms": 0.0}
+    for k in range(folds):
+        held_out = set(scored[k::folds])
+        train = [item for i, item in enumerate(items) if i not in held_out and item["label"]]
+        if len({item["label"] for item in train}) < 2:
+            continue
+        model = IntentClassifier().fit([t["text"] for t in train], [t["label"] for t in train])
+        test = [items[i] for i in held_out]
+        report = evaluate(model, [t["text"] for t in test], [t[reference] for t in test], threshold)
+        totals["n"] += report["n"]
+        totals["correct"] += round(report["accuracy"] * report["n"])
+        totals["covered"] += report["router_calls_avoided"]
+        if report["accuracy_when_confident"] is not None:
+            totals["covered_correct"] += round(report["accuracy_when_confident"] * report["router_calls_avoided"])
+        totals["latency_ms"] += report["avg_latency_ms"] * report["n"]
+
+    n = totals["n"]
+    if not n:
+        return {"n": 0}
+    return {
+        "n": n,
+        "accuracy": totals["correct"] / n,
+        "coverage": totals["covered"] / n,
+        "accuracy_when_confident": totals["covered_correct"] / totals["covered"] if totals["covered"] else None,
+        "router_calls_avoided": totals["covered"],
+        "avg_latency_ms": totals["latency_ms"] / n,
+    }
+
+
+def print_report(title: str, report: dict):
+    print(f"\n📊 {title}")
+    if "accuracy" not in report:
+        print(f"   (sin datos suficientes: {report['n']} ejemplos)")
+        return
+    acc_conf = report["accuracy_when_confident"]
+    print(f"   Ejemplos evaluados:          {report['n']}")
+    print(f"   Accuracy (todas):            {report['accuracy']:.1%}")
+    print(f"   Cobertura sobre umbral:      {report['coverage']:.1%}")
+    print(f"   Accuracy sobre umbral:       {acc_conf:.1%}" if acc_conf is not None else "   Accuracy sobre umbral:       -")
+    print(f"   Llamadas al router evitadas: {report['router_calls_avoided']} / {report['n']}")
+    print(f"   Latencia media:              {report['avg_latency_ms']:.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrena el clasificador de intención local.")
+    parser.add_argument("--logs", nargs="+", default=["interaction_logs"], help="Directorios con interactions_*.jsonl")
+    parser.add_argument("--label-with-router", action="store_true", help="Etiquetar mensajes sin ruta con el router LLM")
+    parser.add_argument("--threshold", type=float, default=settings.INTENT_CLASSIFIER_THRESHOLD)
+    parser.add_argument("--output", default=settings.INTENT_MODEL_PATH)
+    args = parser.parse_args()
+
+    print("🔍 JARVISZ - Entrenamiento del Router Local")
+    print("=" * 80)
+
+    messages = load_labeled_messages(args.logs)
+    router_labels = load_router_labels()
+    if args.label_with_router:
+        router_labels = asyncio.run(label_with_router(messages, router_labels))
+
+    items = []
+    for key, m in messages.items():
+        router = m["router"] or router_labels.get(key)
+        # Human review wins over the router when both exist
+        items.append({"text": m["text"], "gold": m["gold"], "router": router, "label": m["gold"] or router})
+
+    labeled = [item for item in items if item["label"]]
+    print(f"\nMensajes únicos: {len(items)} | Etiquetados: {len(labeled)}")
+    for route in sorted({item["label"] for item in labeled}):
+        print(f"   {route}: {sum(1 for item in labeled if item['label'] == route)}")
+
+    if len({item["label"] for item in labeled}) < 2:
+        print("\n❌ Hacen falta ejemplos de al menos 2 rutas. Probá con --label-with-router.")
+        return
+
+    # Evaluation (5-fold cross-validation)
+    vs_router = cross_validate(items, "router", args.threshold)
+    vs_review = cross_validate(items, "gold", args.threshold)
+    print_report(f"Contra el router LLM (umbral {args.threshold})", vs_router)
+    print_report(f"Contra la revisión humana (umbral {args.threshold})", vs_review)
+
+    # Final model on everything
+    model = IntentClassifier().fit([i["text"] for i in labeled], [i["label"] for i in labeled])
+    model.save(args.output)
+
+    report_path = Path(args.output).with_suffix(".report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "threshold": args.threshold,
+            "examples": len(labeled),
+            "features": len(model.vocab),
+            "vs_router": vs_router,
+            "vs_review": vs_review,
+        }, f, indent=2)
+
+    print(f"\n✅ Modelo guardado en {args.output} ({len(model.vocab)} features)")
+    print(f"📝 Reporte guardado en {report_path}")
+
+
+if __name__ == "__main__":
+    main()